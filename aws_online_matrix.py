@@ -1,12 +1,19 @@
 import screening as m
+import solvers
+import argparse
 import random
+import sys
 import pymysql
 import csv
 import toml
 import datetime
+import multiprocessing
+import os
+import signal
+import time as time_module
 from collections import Counter, defaultdict
+from queue import Empty
 from pyomo.environ import *
-from pyomo.opt import SolverFactory
 
 year = "2022"
 workshop = "Feb"
@@ -14,8 +21,50 @@ batch = 1
 
 interview_number = 4
 max_faculty_interview = 10
+top_k = None  # Faculty kept per student before solving (None: all faculty)
+engine = "mip"  # "mip": single model, "two stage": pair assignment then timing (decomposition.py)
+               # "draft": flow assignment and greedy placement only (heuristics.py)
+               # "repair": minimal changes to the matrix in the database after withdrawals
+               #           or availability changes (heuristics.py, needs resume)
+               # "anneal": simulated annealing until anneal_budget runs out (heuristics.py)
+               # "column generation": one column per student schedule (colgen.py)
+               # "lp draft": LP relaxation, randomized rounding and greedy completion,
+               #             with the LP bound (heuristics.py)
+               # "rolling horizon": quotas split by time block, then one block at a time
+               #                    (decomposition.py)
+               # "clusters": field clusters of the matching graph solved in parallel
+               #             (decomposition.py)
+               # "direct": same model as "mip" generated without Pyomo, streamed to an LP file
+               #           for CBC or kept in memory for HiGHS (direct_model.py)
+warm_start = True  # Starts the "mip" engine from the heuristic draft
+resume = True  # Keeps what is still valid in the matrix currently in the database as a start
+anneal_budget = 300  # Seconds of search for the "anneal" engine
+workers = None  # Processes of the "rolling horizon" (1: blocks in sequence) and "clusters" engines
+                # (None: one per core)
+backend = "cbc"  # "cbc", "glpk" or "highs" (scipy, nothing to install), also --backend on the command line
+backend_options = {"cbc": {"threads": os.cpu_count(), "ratioGap": None, "sec": None},
+                   "glpk": {"tmlim": None, "mipgap": None},
+                   "highs": {"time_limit": None, "mip_rel_gap": None}}  # None: solver default
+persistent_backend = "highs"  # Persistent solver of persistent_model: "highs", "cbc" or "gurobi"
+portfolio = []  # (backend, options) solved in parallel by the "mip" engine, empty: backend alone
+# portfolio = [("cbc", {"randomCbcSeed": 1}), ("cbc", {"randomCbcSeed": 2}),
+#              ("cbc", {"randomCbcSeed": 3, "cutsOnOff": "root"}),
+#              ("cbc", {"randomCbcSeed": 4, "heuristicsOnOff": "off"}), ("glpk", {}), ("highs", {})]
+portfolio_deadline = 600  # Seconds before the portfolio keeps its best incumbent
+checkpoint = None  # File keeping the best schedule during the "mip" solve, and its start with resume
+                   # (None: no checkpoints), also --checkpoint on the command line
+checkpoint_interval = 60  # Seconds between two checkpoints
+time_limit = None  # Wall-clock seconds of the "mip" solve with checkpoints (None: no limit), also --time-limit
+telemetry_log = "telemetry.jsonl"  # Model sizes, solver progress and results of the "mip" engine, appended
+                                   # as JSON lines to compare workshops (None: console only)
+progress_interval = 5  # Seconds between two progress reports of the solver
+break_symmetry = True  # Merges identical times and orders identical students in the "mip" engine
+elastic = False  # Quotas and availability become penalized slacks in the "mip" engine, so it always
+                 # returns a schedule and lists what had to be violated (weights "missed interview"
+                 # and "unavailable")
 
 interview_low_score = 10  # Prints interviews with scores that low
+interview_break = datetime.timedelta(minutes=15)  # Break needed between two interviews of a person
 
 weights = {"core core": 10, "core minor": 5, "minor minor": 2, "interest": 100, "invite": 50  # Faculty wants to interview
            , "rejected": -10  # Faculty said no during screening
@@ -24,7 +73,11 @@ weights = {"core core": 10, "core minor": 5, "minor minor": 2, "interest": 100,
            , "maybe available": -10  # Faculty maybe available
            , "block": -10  # Cost for extra time block
            , "consecutive": 10  # Trying to get consecutive interviews
+           , "missed interview": -1000000  # Elastic mode: interview missing from a student's quota
+           , "unavailable": -100000  # Elastic mode: interview at a time one side said no (per side)
            }
+# Weights that stay parameters of the model in persistent_model, with max_faculty_interview
+mutable_weights = ["invite", "rejected", "maybe available", "consecutive", "block"]
 
 # SQL scripts for selection_2021
 
@@ -87,6 +140,10 @@ FROM availabilities
 WHERE faculty_id IS NULL
 """
 
+previous_matrix_sql = """
+SELECT faculty_id, user_id, time_id FROM matrix WHERE current
+"""
+
 times_sql = """
 select id, time_block_id, times.from, times.to FROM times order by times.from
 """
@@ -126,7 +183,8 @@ def get_times(db):
     # Sort IDs for each time_block to make sure
     blocks = {b: sorted(blocks[b]) for b in blocks}
 
-    # Check that all times are ordered by id, if no issues, we assume that it is the case
+    # Check that all times are ordered by id
+    # Only informative, overlaps are computed from the timestamps (see get_conflicts)
     for t1, t2 in zip(times.keys(), list(times.keys())[1:]):
         if t2 != t1 + 1:
             print(f"WARNING: Times IDs are not continuous: ({t1} and {t2})")
@@ -151,7 +209,8 @@ def get_students(selection_db, aws_db, applicants_sql, student_fields_sql):
             faculty = [f1, f2, f3]
             cores = []
             minors = []
-            students[id] = {"name": f"{last} {first}", "faculty": faculty, "core": cores, "minor": minors, "match": {}, "comment": comment
+            students[id] = {"name": f"{last} {first}", "faculty": faculty, "core": cores, "minor": minors, "match": {}, "comment": comment,
+                            "requested": [], "invited": [], "rejected": []
                             }
 
     with aws_db.cursor() as cursor:
@@ -212,11 +271,56 @@ def worst_availability(available, available_next):
             return available
     
 
-def add_availability_and_check(db, faculty, students, times, time_blocks):
+def get_previous_matrix(db):
+    """
+    Reads the matrix currently in the database, before add_availability_and_check clears it
+    Returns: list of (fac, stu, time)
+    """
+    with db.cursor() as cursor:
+        cursor.execute(previous_matrix_sql)
+        return [(fac, stu, time) for fac, stu, time in cursor.fetchall()]
+
+
+def clean_previous_matrix(matrix, times, faculty, students):
+    """
+    Drops the interviews of a previous matrix that became infeasible:
+    withdrawn students or faculty, removed or newly unavailable times, hard-excluded pairs,
+    and interviews that overlap or go over the quotas of interviews kept before them
+    Returns: list of (fac, stu, time)
+    """
+    dropped = Counter()
+    kept = []
+    busy = defaultdict(list)
+    met = set()
+    for fac, stu, time in matrix:
+        if stu not in students or fac not in faculty:
+            dropped["withdrawn"] += 1
+        elif time not in times:
+            dropped["unknown time"] += 1
+        elif time in faculty[fac]["avail"]["no"] or time in students[stu]["avail"]["no"]:
+            dropped["unavailable"] += 1
+        elif hard_excluded(students, stu, fac):
+            dropped["excluded pair"] += 1
+        elif (fac, stu) in met or any(times_overlap(times, time, other) for other in busy[fac] + busy[stu]):
+            dropped["overlap"] += 1
+        elif len(busy[stu]) >= interview_number or len(busy[fac]) >= max_faculty_interview:
+            dropped["over quota"] += 1
+        else:
+            kept.append((fac, stu, time))
+            busy[fac].append(time)
+            busy[stu].append(time)
+            met.add((fac, stu))
+
+    print(f"Previous matrix: kept {len(kept)} of {len(matrix)} interviews, dropped {dict(dropped)}")
+    return kept
+
+
+def add_availability_and_check(db, faculty, students, times, time_blocks, read_only=False):
     """
     Adds availability from faculty
     Also check IDs are consistent
     Removes students not in matrix (deferred or cancelled students)
+    With read_only, the matrix table is left as it is
     """
     # Filtering to students in matrix
     with db.cursor() as cursor:
@@ -226,8 +330,9 @@ def add_availability_and_check(db, faculty, students, times, time_blocks):
     students = {s: students[s] for s in students if s in stu_avail}
 
     # Delete everything from matrix to start fresh
-    with db.cursor() as cursor:
-        cursor.execute("DELETE FROM matrix;")
+    if not read_only:
+        with db.cursor() as cursor:
+            cursor.execute("DELETE FROM matrix;")
 
     # Checking faculty IDs are consistent
     print("\nFaculty ID checks:")
@@ -296,9 +401,11 @@ def add_availability_and_check(db, faculty, students, times, time_blocks):
 
     # The availability of the last time slot in the each block must take into account the next availability since it overlaps
     last_times = [time_blocks[b][-1] for b in sorted(time_blocks.keys())[:-1]]
+    ordered_times = sorted(times, key=lambda t: times[t]["from"])
+    next_times = dict(zip(ordered_times, ordered_times[1:]))
     for fac in faculty:
         for last_time in last_times:
-            next_time = last_time + 1
+            next_time = next_times.get(last_time)
             for available in ["yes", "maybe", "no"]:
                 if last_time in faculty[fac]["avail"][available]:
                     available_last = available
@@ -321,7 +428,7 @@ def add_availability_and_check(db, faculty, students, times, time_blocks):
     # The availability of the last time slot in the each block must take into account the next availability since it overlaps
     for stu in students:
         for last_time in last_times:
-            next_time = last_time + 1
+            next_time = next_times.get(last_time)
             available_last, available_next = "", ""
             for available in ["yes", "maybe", "no"]:
                 if last_time in students[stu]["avail"][available]:
@@ -358,6 +465,7 @@ def force_interviews(students, faculty, forced):
             print("Forced interview faculty ", fac, "not found")
         else:
             students[stu]["match"][fac] += weights["force"]
+            students[stu]["requested"].append(fac)
 
 
 
@@ -389,6 +497,8 @@ def requested_interviews(db, faculty, students):
                 matches = students[stu]["match"]
                 if fac_id in matches:
                     matches[fac_id] += weights["invite"]
+                    students[stu]["requested"].append(fac_id)
+                    students[stu]["invited"].append(fac_id)
                     n += 1
                     requested.append(
                         (students[stu]["name"], faculty[fac_id]["name"]))
@@ -412,6 +522,7 @@ def rejected_students(db, faculty, students):
                 matches = students[stu]["match"]
                 if fac_id in matches:
                     matches[fac_id] += weights["rejected"]
+                    students[stu]["rejected"].append(fac_id)
                     n += 1
                     rejected.append(
                         (students[stu]["name"], faculty[fac_id]["name"]))
@@ -421,133 +532,877 @@ def rejected_students(db, faculty, students):
         print(stu, "\t", fac)
 
 def times_overlap(times, time1, time2):
-    return  abs(times[time1]["from"] - times[time2]["from"]) <= datetime.timedelta(minutes=30)
+    """
+    Two interviews overlap if one starts before the other one ends plus the break
+    """
+    return times[time1]["from"] < times[time2]["to"] + interview_break \
+        and times[time2]["from"] < times[time1]["to"] + interview_break
+
+
+def consecutives(times, person_times):
+    """
+    Caclulates the number of consecutive interviews (with a break in between)
+    """
+    starts = set(times[t]["from"] for t in person_times)
+    return sum(times[t]["to"] + interview_break in starts for t in person_times)
+
+
+def get_conflicts(times):
+    """
+    Conflict index built from the real start and end of each time slot,
+    so it does not depend on time IDs being contiguous.
+    Each slot is blocked from its start to its end plus the break, which makes
+    the conflict graph an interval graph: its maximal cliques are the sets of
+    slots blocked at the start of some slot.
+    Returns: (list of maximal cliques as sorted time lists, ordered by time,
+              list of (t1, t2) pairs where t2 starts exactly one break after t1 ends)
+    """
+    ordered = sorted(times, key=lambda t: (times[t]["from"], t))
+    cliques = []
+    for time in ordered:
+        start = times[time]["from"]
+        clique = [t for t in ordered
+                  if times[t]["from"] <= start < times[t]["to"] + interview_break]
+        if cliques and set(cliques[-1]) <= set(clique):
+            cliques[-1] = clique
+        elif not cliques or not set(clique) <= set(cliques[-1]):
+            cliques.append(clique)
+
+    starts = defaultdict(list)
+    for t in times:
+        starts[times[t]["from"]].append(t)
+    pairs = [(t1, t2) for t1 in ordered for t2 in starts[times[t1]["to"] + interview_break]]
+
+    return (cliques, pairs)
+
+
+def non_overlapping_count(times, person_times):
+    """
+    Maximum number of interviews that fit in the given times without overlap
+    (greedy by earliest end, exact for intervals)
+    """
+    count, free_from = 0, None
+    for t in sorted(person_times, key=lambda t: times[t]["to"]):
+        if free_from is None or times[t]["from"] >= free_from:
+            count += 1
+            free_from = times[t]["to"] + interview_break
+    return count
+
+def hard_excluded(students_all, stu, fac):
+    """
+    Pairs pushed down by the intern weight can never be worth an interview
+    """
+    return students_all[stu]["match"][fac] <= weights["intern"] / 2
+
+
+def candidate_faculty(faculty_all, students_all, student_k):
+    """
+    Keeps each student's top K faculty by matching score,
+    plus faculty of interest and forced or requested interviews
+    Input: faculty and student dictionnaries, dictionary of K, key=student ID
+    Returns: dictionary of faculty sets, key=student ID
+    """
+    candidates = {}
+    for stu in students_all:
+        match = students_all[stu]["match"]
+        ranked = sorted(faculty_all, key=lambda fac: match[fac], reverse=True)
+        candidates[stu] = set(ranked[:student_k[stu]]) \
+            | set(fac for fac in students_all[stu]["faculty"] + students_all[stu]["requested"] if fac in faculty_all)
+    return candidates
+
+
+def interview_slots(times_all, faculty_all, students_all, sparse=True, candidates=None, unavailable=()):
+    """
+    Lists the (fac, stu, time) triples that get a variable in the model.
+    In sparse mode, only keeps the triples where neither side said "no" for the time
+    and where the pair is not hard-excluded, otherwise returns the full product.
+    Candidates (see candidate_faculty) restrict the faculty considered for each student.
+    Students in unavailable also keep the times where one side said "no" (elastic mode).
+    Returns: list of (fac, stu, time)
+    """
+    if candidates is None:
+        candidates = {stu: faculty_all for stu in students_all}
+
+    if not sparse:
+        return [(fac, stu, time) for stu in students_all for fac in faculty_all if fac in candidates[stu]
+                for time in times_all]
+
+    fac_no = {fac: set(faculty_all[fac]["avail"]["no"]) for fac in faculty_all}
+    fac_times = {fac: [t for t in times_all if t not in fac_no[fac]] for fac in faculty_all}
+    stu_no = {stu: set(students_all[stu]["avail"]["no"]) for stu in students_all}
+
+    slots = []
+    for stu in students_all:
+        for fac in faculty_all:
+            if fac not in candidates[stu] or hard_excluded(students_all, stu, fac):
+                continue
+            if stu in unavailable:
+                slots.extend((fac, stu, time) for time in times_all)
+                continue
+            slots.extend((fac, stu, time) for time in fac_times[fac] if time not in stu_no[stu])
+    return slots
+
+
+def overlap_rows(by_person_time, cliques):
+    """
+    Non-overlap rows of each person, restricted to the times where the person has variables.
+    Skips empty rows, rows with a single variable, and rows contained in a neighbouring
+    clique of the same person (cliques of an interval graph sorted by time, so any
+    dominating row is also dominated by, or equal to, a neighbour).
+    Input: variables grouped by (person, time), list of cliques of overlapping times
+    Returns: dictionary of variable lists, key=(person, clique number)
+    """
+    person_times = defaultdict(set)
+    for person, time in by_person_time:
+        person_times[person].add(time)
+
+    rows = {}
+    for person in person_times:
+        restricted = [(number, frozenset(t for t in clique if t in person_times[person]))
+                      for number, clique in enumerate(cliques)]
+        restricted = [(number, row) for number, row in restricted if row]
+        for i, (number, row) in enumerate(restricted):
+            if i > 0 and row <= restricted[i - 1][1]:
+                continue
+            if i + 1 < len(restricted) and row < restricted[i + 1][1]:
+                continue
+            variables = [var for time in sorted(row) for var in by_person_time[person, time]]
+            if len(variables) > 1:
+                rows[person, number] = variables
+    return rows
+
+
+def symmetry_classes(times_all, faculty_all, students_all):
+    """
+    Finds what the model cannot tell apart:
+    times with the same interval and time block and the same availability for everyone,
+    and students with the same matching scores and availability.
+    Returns: (list of time classes, list of student classes), only classes of 2 or more
+    """
+    people = [faculty_all[fac]["avail"] for fac in faculty_all] + [students_all[stu]["avail"] for stu in students_all]
+    people = [(set(avail["no"]), set(avail["maybe"])) for avail in people]
+    time_keys = defaultdict(list)
+    for time in times_all:
+        key = (times_all[time]["from"], times_all[time]["to"], times_all[time]["time block"],
+               tuple((time in no, time in maybe) for no, maybe in people))
+        time_keys[key].append(time)
+
+    student_keys = defaultdict(list)
+    for stu in students_all:
+        avail = students_all[stu]["avail"]
+        key = (tuple(sorted(students_all[stu]["match"].items())),
+               tuple(sorted(avail["no"])), tuple(sorted(avail["maybe"])))
+        student_keys[key].append(stu)
+
+    return ([sorted(c) for c in time_keys.values() if len(c) > 1],
+            [sorted(c) for c in student_keys.values() if len(c) > 1])
+
+
+def aggregate_times(times_all, time_classes):
+    """
+    Keeps one time of each class. Each person uses at most one time of a class
+    and there is no limit per time, so the model keeps the same optimum.
+    Returns: dictionary of times
+    """
+    merged = set(time for c in time_classes for time in c[1:])
+    return {time: times_all[time] for time in times_all if time not in merged}
+
+
+def expand_times(matrix, time_classes):
+    """
+    Spreads the interviews at the kept time of each class over the whole class, in turn
+    Returns: list of (fac, stu, time)
+    """
+    members = {c[0]: c for c in time_classes}
+    used = defaultdict(int)
+    expanded = []
+    for fac, stu, time in matrix:
+        if time in members:
+            used[time] += 1
+            time = members[time][(used[time] - 1) % len(members[time])]
+        expanded.append((fac, stu, time))
+    return expanded
+
+
+def schedule_rank(times_all, faculty_all):
+    """
+    Weight of each (fac, time) used to order the schedules of identical students
+    Returns: dictionary of weights, key=(fac, time)
+    """
+    return {(fac, time): i * len(times_all) + j + 1
+            for i, fac in enumerate(sorted(faculty_all)) for j, time in enumerate(sorted(times_all))}
+
 
-def consecutives(times):
-    """ 
-    Caclulates the number of consecutive interviews (with 15 minute break in between)
+def symmetric_order(matrix, student_classes, rank):
     """
-    return sum(t + 3 in times for t in times)
+    Gives the schedules of identical students back in decreasing rank, so a schedule
+    (e.g. a MIP start) satisfies the symmetry-breaking rows of build_model
+    Returns: list of (fac, stu, time)
+    """
+    schedules = defaultdict(list)
+    for fac, stu, time in matrix:
+        schedules[stu].append((fac, time))
+
+    swapped = {}
+    for students in student_classes:
+        ordered = sorted((schedules[stu] for stu in students),
+                         key=lambda schedule: -sum(rank.get(slot, 0) for slot in schedule))
+        swapped.update(zip(students, ordered))
+    for stu in schedules:
+        swapped.setdefault(stu, schedules[stu])
+    return [(fac, stu, time) for stu in swapped for fac, time in swapped[stu]]
 
-def make_matrix(times_all, faculty_all, students_all):
+
+def interview_coefficients(slots, faculty_all, students_all):
+    """
+    Objective coefficient of each (fac, stu, time) triple:
+    matching score plus the maybe-available and unavailable penalties of each side
+    Returns: dictionary of coefficients, key=(fac, stu, time)
+    """
+    fac_maybe = {fac: set(faculty_all[fac]["avail"]["maybe"]) for fac in faculty_all}
+    stu_maybe = {stu: set(students_all[stu]["avail"]["maybe"]) for stu in students_all}
+    fac_no = {fac: set(faculty_all[fac]["avail"]["no"]) for fac in faculty_all}
+    stu_no = {stu: set(students_all[stu]["avail"]["no"]) for stu in students_all}
+
+    coefficients = {}
+    for fac, stu, time in slots:
+        maybes = (time in fac_maybe[fac]) + (time in stu_maybe[stu])
+        noes = (time in fac_no[fac]) + (time in stu_no[stu])
+        coefficients[fac, stu, time] = students_all[stu]["match"][fac] + weights["maybe available"] * maybes \
+            + weights["unavailable"] * noes
+    return coefficients
+
+
+def check_weights(new_weights):
+    """
+    The consecutive and block indicators of build_model are linked from one side only:
+    a consecutive indicator can only be on with both interviews, a block indicator must
+    be on with any interview in the block. So the model is only right with a consecutive
+    weight >= 0 and a block weight <= 0.
+    Input: dictionary of weights (may hold only some of them)
+    """
+    if new_weights.get("consecutive", 0) < 0:
+        raise ValueError(f"The consecutive weight must be >= 0, not {new_weights['consecutive']}")
+    if new_weights.get("block", 0) > 0:
+        raise ValueError(f"The block weight must be <= 0, not {new_weights['block']}")
+
+
+def build_model(times_all, faculty_all, students_all, sparse=True, candidates=None, student_classes=(),
+                mutable=False, elastic=False, partial=False):
+    """
+    Builds the interview model.
+    In sparse mode (default), variables only exist for feasible (fac, stu, time) triples,
+    otherwise the full product is used and unavailable slots are forced to 0.
+    Student classes (see symmetry_classes) get symmetry-breaking rows.
+    With mutable, the mutable_weights and max_faculty_interview are the mutable
+    parameters model.weight and model.max_interviews, so they can change without a rebuild.
+    With elastic, missing interviews are the penalized slacks model.missed, and students
+    who cannot get a full schedule (feasibility.short_students) also get variables at
+    unavailable times, penalized by weights["unavailable"]. The model is always feasible.
+    With partial, the data is only part of the workshop (decomposition engines) and
+    students without a slot in it are not reported.
+    Returns: Pyomo model
+    """
     # Define parameters
+    check_weights(weights)
     times = times_all.keys()
-    faculty = faculty_all.keys()
-    students = students_all.keys()
+    cliques, consecutive_pairs = get_conflicts(times_all)
+    if elastic:
+        import feasibility
+        stretched = feasibility.short_students(times_all, faculty_all, students_all)
+    else:
+        stretched = ()
 
     # Initialize model
     model = ConcreteModel()
 
     # binary variables representing the time and session of each fac
-    model.grid = Var(((fac, stu, time) for fac in faculty for stu in students for time in times),
+    model.grid = Var(interview_slots(times_all, faculty_all, students_all, sparse, candidates, stretched),
                      within=Binary, initialize=0)
 
+    # Group variables by person, pair and time in one pass
+    by_stu, by_fac, by_pair = defaultdict(list), defaultdict(list), defaultdict(list)
+    by_fac_time, by_stu_time = defaultdict(list), defaultdict(list)
+    for fac, stu, time in model.grid:
+        var = model.grid[fac, stu, time]
+        by_stu[stu].append(var)
+        by_fac[fac].append(var)
+        by_pair[fac, stu].append(var)
+        by_fac_time[fac, time].append(var)
+        by_stu_time[stu, time].append(var)
+
+    # Objective: single linear expression built in one pass over the variables
+    # The consecutive and block terms used to be evaluated with value() on the
+    # unsolved grid, which made them constants the solver could not optimize
+    coefficients = interview_coefficients(model.grid, faculty_all, students_all)
+    if mutable:
+        model.weight = Param(mutable_weights, mutable=True, initialize={w: weights[w] for w in mutable_weights})
+        model.max_interviews = Param(mutable=True, initialize=max_faculty_interview)
+        w, cap = model.weight, model.max_interviews
+        # The invite, rejected and maybe terms leave the coefficients to be multiplied by their parameter
+        terms = {"invite": defaultdict(int), "rejected": defaultdict(int), "maybe available": defaultdict(int)}
+        for fac, stu, time in model.grid:
+            terms["invite"][fac, stu, time] = int(fac in students_all[stu]["invited"])
+            terms["rejected"][fac, stu, time] = int(fac in students_all[stu]["rejected"])
+            terms["maybe available"][fac, stu, time] = (time in faculty_all[fac]["avail"]["maybe"]) \
+                + (time in students_all[stu]["avail"]["maybe"])
+        for index in model.grid:
+            coefficients[index] -= sum(weights[term] * terms[term][index] for term in terms)
+        matching = quicksum(coefficients[index] * model.grid[index] for index in model.grid) \
+            + quicksum(w[term] * quicksum(n * model.grid[index] for index, n in terms[term].items() if n)
+                       for term in terms)
+    else:
+        w, cap = weights, max_faculty_interview
+        matching = quicksum(coefficients[index] * model.grid[index] for index in model.grid)
+
+    # Indicator: faculty interviews in a time block, one per (fac, block) with variables
+    by_fac_block = defaultdict(list)
+    for fac, stu, time in model.grid:
+        by_fac_block[fac, times_all[time]["time block"]].append(model.grid[fac, stu, time])
+    block_times = defaultdict(list)
+    for time in times:
+        block_times[times_all[time]["time block"]].append(time)
+    block_capacity = {block: non_overlapping_count(times_all, block_times[block]) if mutable
+                      else min(max_faculty_interview, non_overlapping_count(times_all, block_times[block]))
+                      for block in block_times}
+    model.fac_block = Var(list(by_fac_block), within=Binary, initialize=0)
+
+    # Indicator: person has interviews at both t1 and t2 (consecutive with a break)
+    # Only maximized, so continuous indicators are integral at any binary grid
+    fac_pairs = [(fac, t1, t2) for fac in by_fac for t1, t2 in consecutive_pairs
+                 if (fac, t1) in by_fac_time and (fac, t2) in by_fac_time]
+    stu_pairs = [(stu, t1, t2) for stu in by_stu for t1, t2 in consecutive_pairs
+                 if (stu, t1) in by_stu_time and (stu, t2) in by_stu_time]
+    model.fac_consecutive = Var(fac_pairs, within=UnitInterval, initialize=0)
+    model.stu_consecutive = Var(stu_pairs, within=UnitInterval, initialize=0)
+
+    # Slack: interviews missing from each student's quota (elastic mode only)
+    model.missed = Var(list(students_all) if elastic else [], bounds=(0, interview_number), initialize=0)
+
+    model.obj = Objective(expr=matching
+                          + w["consecutive"] * (quicksum(model.fac_consecutive.values())
+                                                + quicksum(model.stu_consecutive.values()))
+                          + w["block"] * quicksum(model.fac_block.values())
+                          + weights["missed interview"] * quicksum(model.missed.values()),
+                          sense=maximize)
 
-    # Define an objective function with model as input, to pass later
-    def obj_rule(m):
-        matching = sum(m.grid[fac, stu, time] * students_all[stu]["match"][fac]
-                       for fac, stu, time in m.grid)
+    # Constraint: N interviews per student
+    for stu in students_all:
+        if stu not in by_stu and not partial:
+            print(f"WARNING: Student {stu} has no available time slot with any faculty")
+    if elastic:
+        print(f"Elastic: {len(stretched)} students may be scheduled at unavailable times")
+        model.student_quota = Constraint(list(students_all), rule=lambda m, stu:
+                                         sum(by_stu.get(stu, [])) + m.missed[stu] == interview_number)
+    else:
+        model.student_quota = Constraint(list(by_stu), rule=lambda m, stu:
+                                         sum(by_stu[stu]) == interview_number)
+
+    # Constraint: Maximum interviews per faculty (useless if the faculty cannot reach it)
+    capped = [fac for fac in by_fac if mutable or len(by_fac[fac]) > max_faculty_interview]
+    model.faculty_capacity = Constraint(capped, rule=lambda m, fac:
+                                        sum(by_fac[fac]) <= cap)
 
-        fac_maybe = sum(m.grid[fac, stu, time] *
-                        (time in faculty_all[fac]["avail"]["maybe"])
-                        for fac, stu, time in m.grid)
+    # Constraint: each student/faculty pair interviews maximum once
+    repeated = [pair for pair in by_pair if len(by_pair[pair]) > 1]
+    model.pair_once = Constraint(repeated, rule=lambda m, fac, stu: sum(by_pair[fac, stu]) <= 1)
+
+    # Constraint: No interview on unavailable time slots for faculty and students
+    # (only needed without the sparse index, which never creates these variables,
+    # and penalized instead in elastic mode)
+    if not sparse and not elastic:
+        fac_no = {fac: set(faculty_all[fac]["avail"]["no"]) for fac in faculty_all}
+        stu_no = {stu: set(students_all[stu]["avail"]["no"]) for stu in students_all}
+        unavailable = [model.grid[fac, stu, time] for fac, stu, time in model.grid
+                       if time in fac_no[fac] or time in stu_no[stu]]
+        if unavailable:
+            model.unavailable = Constraint(expr=sum(unavailable) == 0)
+
+    # Constraint: faculty block indicator is on if any interview happens in the block
+    # The big-M is the number of interviews that fit in the block, so it stays tight
+    model.fac_block_link = Constraint(list(by_fac_block), rule=lambda m, fac, block:
+                                      sum(by_fac_block[fac, block]) <= block_capacity[block] * m.fac_block[fac, block])
+
+    # Constraint: consecutive indicators need an interview at both times
+    model.fac_consecutive_link = Constraint(fac_pairs, [0, 1], rule=lambda m, fac, t1, t2, side:
+                                            m.fac_consecutive[fac, t1, t2] <= sum(by_fac_time[fac, (t1, t2)[side]]))
+    model.stu_consecutive_link = Constraint(stu_pairs, [0, 1], rule=lambda m, stu, t1, t2, side:
+                                            m.stu_consecutive[stu, t1, t2] <= sum(by_stu_time[stu, (t1, t2)[side]]))
+
+    # Constraint: No overlapping interviews, one row per person and maximal clique of overlapping times
+    # The rows also cover "max one interview per time" for each person
+    fac_overlap = overlap_rows(by_fac_time, cliques)
+    stu_overlap = overlap_rows(by_stu_time, cliques)
+    model.fac_overlap = Constraint(list(fac_overlap), rule=lambda m, fac, clique: sum(fac_overlap[fac, clique]) <= 1)
+    model.stu_overlap = Constraint(list(stu_overlap), rule=lambda m, stu, clique: sum(stu_overlap[stu, clique]) <= 1)
+
+    skipped = len(cliques) * (len(by_fac) + len(by_stu)) - len(fac_overlap) - len(stu_overlap)
+    print(f"Overlap rows: {len(fac_overlap) + len(stu_overlap)} kept, {skipped} empty or dominated skipped")
+
+    # Constraint: identical students take their schedules in decreasing rank
+    # Swapping the schedules of two identical students changes nothing, so only one
+    # order is kept. Only students with the same variables (top-K may differ) are chained
+    rank = schedule_rank(times_all, faculty_all)
+    student_slots = defaultdict(set)
+    for fac, stu, time in model.grid:
+        student_slots[stu].add((fac, time))
+    chained = [(s1, s2) for students in student_classes for s1, s2 in zip(students, students[1:])
+               if student_slots[s1] == student_slots[s2]]
+    model.student_symmetry = Constraint(chained, rule=lambda m, s1, s2:
+                                        sum(rank[fac, time] * m.grid[fac, s1, time] for fac, time in student_slots[s1])
+                                        >= sum(rank[fac, time] * m.grid[fac, s2, time] for fac, time in student_slots[s2]))
+    if chained:
+        print(f"Symmetry: {len(chained)} rows ordering identical students")
 
-        stu_maybe = sum(m.grid[fac, stu, time] *
-                        (time in students_all[stu]["avail"]["maybe"])
-                        for fac, stu, time in m.grid)
+    return model
 
-        stu_consecutive = sum(consecutives([time for fac, s, time in m.grid if s == stu and value(m.grid[fac, s, time])])
-                              for stu in students)
 
-        fac_consecutive = sum(consecutives([time for f, stu, time in m.grid if f == fac and value(m.grid[f, stu, time])])
-                              for fac in faculty)
+def solve_model(model, duals=False, warmstart=False, progress=None):
+    """
+    Solves the model with the selected backend, loading the solution only if one was found.
+    With warmstart, the current variable values are passed to the solver as a MIP start.
+    Progress is reported during the solve (see solvers.progress_logger).
+    Returns: result dictionary (see solvers.make_result)
+    """
+    return solvers.solve(model, backend, backend_options.get(backend), duals, warmstart, progress)
 
-        # stu_time_blocks = len(set((stu, times_all[time]["time block"])
-        #                           for fac, stu, time in m.grid if m.grid[fac, stu, time]))
 
-        fac_time_blocks = len(set((fac, times_all[time]["time block"])
-                                  for fac, stu, time in m.grid if value(m.grid[fac, stu, time])))
+def is_infeasible(results):
+    return solvers.is_infeasible(results)
 
-        return matching \
-            + weights["maybe available"] * (fac_maybe + stu_maybe) \
-            + weights["consecutive"] * (fac_consecutive + stu_consecutive) \
-            + weights["block"] * fac_time_blocks #+ stu_time_blocks)
 
-    # add objective function to the model. rule (pass function) or expr (pass expression directly)
-    model.obj = Objective(rule=obj_rule, sense=maximize)
+def students_to_expand(model, times_all, faculty_all, students_all, candidates):
+    """
+    Prices the pruned pairs with the duals of the LP relaxation of the pruned model.
+    A pruned (fac, stu, time) can only improve the LP if its coefficient, plus the most
+    it can add through consecutive indicators, is above the dual of the student quota
+    (all other rows are <= rows with nonnegative duals).
+    Returns: (list of students with a pruned pair pricing out, LP bound or None if infeasible)
+    """
+    relaxed = TransformationFactory('core.relax_integer_vars').create_using(model)
+    results = solve_model(relaxed, duals=True)
+    if is_infeasible(results):
+        return (list(students_all), None)
 
-    model.constraints = ConstraintList()  # Create a set of constraints
+    pruned = [(fac, stu, time) for fac, stu, time in interview_slots(times_all, faculty_all, students_all)
+              if fac not in candidates[stu]]
+    coefficients = interview_coefficients(pruned, faculty_all, students_all)
+    bonus = 4 * max(weights["consecutive"], 0)  # Two consecutive pairs each for the student and faculty
 
-    # Constraint: N interviews per student
-    for stu in students:
-        model.constraints.add(
-            sum(model.grid[fac, stu, time] for fac in faculty for time in times) == interview_number
-        )
+    expand = set()
+    for fac, stu, time in pruned:
+        if stu in expand:
+            continue
+        quota = relaxed.student_quota[stu] if stu in relaxed.student_quota else None
+        dual = relaxed.dual.get(quota, 0) if quota is not None else 0
+        if coefficients[fac, stu, time] + bonus > dual + 1e-6:
+            expand.add(stu)
 
-    # Constraint: Maximum interviews per faculty
-    for fac in faculty:
-        model.constraints.add(
-            sum(model.grid[fac, stu, time] for stu in students for time in times) <= max_faculty_interview
-        )
+    return (sorted(expand), value(relaxed.obj))
 
-    # Constraint: Max one interview per time per faculty
-    for fac in faculty:
-        for time in times:
-            model.constraints.add(
-                sum(model.grid[fac, stu, time] for stu in students) <= 1
-            )
 
-    # Constraint: Max one interview per time per student
-    for stu in students:
-        for time in times:
-            model.constraints.add(
-                sum(model.grid[fac, stu, time] for fac in faculty) <= 1
-            )
+def set_start(model, matrix, times_all):
+    """
+    Sets the variable values of a model built by build_model to a given schedule,
+    including the block and consecutive indicators, to be used as a MIP start.
+    Interviews without a variable in the model are ignored.
+    Returns: number of interviews set
+    """
+    for var in model.component_data_objects(Var):
+        var.set_value(0)
 
-    # Constraint: each student/faculty pair interviews maximum once
-    for stu in students:
-        for fac in faculty:
-            model.constraints.add(
-                sum(model.grid[fac, stu, time] for time in times) <= 1
-            )
-
-    # Constraint: No interview on unavailable time slots for faculty and students    
-    model.constraints.add(
-                sum(model.grid[fac, stu, time] for stu in students for fac in faculty for time in times  
-                           if time in faculty_all[fac]["avail"]["no"] + students_all[stu]["avail"]["no"] ) == 0
-            )
-
-    # Constraint: No overlapping interviews
-    for time in times:
-        overlapping_times = [t for t in [time, time + 1, time + 2] if t in times]
-        for fac in faculty:
-            model.constraints.add(
-                    sum(model.grid[fac, stu, time2] for stu in students for time2 in overlapping_times) <= 1
-                )
-        for stu in students:
-            model.constraints.add(
-                    sum(model.grid[fac, stu, time2] for fac in faculty for time2 in overlapping_times) <= 1
-                )
+    person_times = defaultdict(set)
+    n = 0
+    for fac, stu, time in matrix:
+        if (fac, stu, time) in model.grid:
+            model.grid[fac, stu, time].set_value(1)
+            person_times[fac].add(time)
+            person_times[stu].add(time)
+            n += 1
+
+    for fac, block in model.fac_block:
+        if any(times_all[time]["time block"] == block for time in person_times[fac]):
+            model.fac_block[fac, block].set_value(1)
+    for indicator in [model.fac_consecutive, model.stu_consecutive]:
+        for person, t1, t2 in indicator:
+            if t1 in person_times[person] and t2 in person_times[person]:
+                indicator[person, t1, t2].set_value(1)
+    for stu in model.missed:
+        model.missed[stu].set_value(max(interview_number - len(person_times[stu]), 0))
+
+    return n
+
+
+def make_matrix(times_all, faculty_all, students_all, sparse=True, top_k=top_k, start=None, lp_draft=False,
+                symmetry=break_symmetry, elastic=elastic, rows=None):
+    """
+    Builds and solves the interview model.
+    With top_k, each student only gets variables for their top K faculty (see candidate_faculty).
+    K grows for students whose pruned pairs price out against the LP duals of the
+    restricted model, and for everyone if the pruned model is infeasible. The pricing
+    only checks the LP relaxation, so the result is not guaranteed to be optimal for
+    the full model.
+    A start schedule (list of (fac, stu, time), e.g. heuristics.quick_draft) is passed
+    to the solver as a MIP start.
+    With lp_draft, only the LP relaxation is solved and rounded (see lp_draft_matrix).
+    With symmetry, identical times are merged before solving and spread back after,
+    and identical students are ordered (see symmetry_classes).
+    With elastic, quotas and availability are soft (see build_model), so a schedule is
+    always returned, and the violations are printed (see elastic_violations).
+    rows(model) is the schedule written to checkpoints (see solve_mip, default solution_matrix).
+    The size of each model and the progress of the solver are printed and logged to telemetry_log.
+    Returns: list of (fac, stu, time)
+    """
+    rows = rows or solution_matrix
+    if symmetry:
+        time_classes, student_classes = symmetry_classes(times_all, faculty_all, students_all)
+        print(f"Symmetry: {sum(len(c) - 1 for c in time_classes)} identical times merged, "
+              f"{len(student_classes)} classes of identical students")
+        if time_classes:
+            kept = aggregate_times(times_all, time_classes)
+            merged = {time: c[0] for c in time_classes for time in c}
+            if start:
+                start = [(fac, stu, merged.get(time, time)) for fac, stu, time in start]
+            matrix = make_matrix(kept, faculty_all, students_all, sparse, top_k, start, lp_draft, symmetry,
+                                 elastic, lambda model: expand_times(rows(model), time_classes))
+            return expand_times(matrix, time_classes)
+    else:
+        student_classes = ()
+
+    if lp_draft:
+        return lp_draft_matrix(build_model(times_all, faculty_all, students_all, sparse, elastic=elastic),
+                               times_all, faculty_all, students_all)
+    if start and student_classes:
+        start = symmetric_order(start, student_classes, schedule_rank(times_all, faculty_all))
+
+    report = solvers.progress_logger(telemetry_log, f"{year} {workshop} batch {batch}", progress_interval)
+    student_k = {stu: top_k or len(faculty_all) for stu in students_all}
+    while True:
+        pruned = any(student_k[stu] < len(faculty_all) for stu in students_all)
+        candidates = candidate_faculty(faculty_all, students_all, student_k) if pruned else None
+        # The symmetry rows are left out while pruning, the pricing does not account for them
+        model = build_model(times_all, faculty_all, students_all, sparse, candidates,
+                            () if pruned else student_classes, elastic=elastic)
+        solvers.show_model_size(model, report)
+        if not pruned:
+            results = solve_mip(model, times_all, start, rows, report)
+            break
+
+        print(f"Top-K pruning: {len(model.grid)} variables, K from {min(student_k.values())} to {max(student_k.values())}")
+        expand, bound = students_to_expand(model, times_all, faculty_all, students_all, candidates)
+        if not expand:
+            results = solve_mip(model, times_all, start, rows, report)
+            if not is_infeasible(results):
+                print(f"No pruned pair prices out, LP value of the restricted model: {bound}")
+                break
+            expand = list(students_all)
+        print(f"Top-K pruning: growing K for {len(expand)} students")
+        for stu in expand:
+            student_k[stu] = min(2 * student_k[stu], len(faculty_all))
 
+    print(solvers.summary(results))
+    report({"event": "result", **results})
+    if elastic:
+        violations = elastic_violations(model, faculty_all, students_all)
+        print(f"\nElastic: {len(violations)} violations")
+        for violation in violations:
+            print(violation)
 
+    return solution_matrix(model)
 
-    # opt = SolverFactory('cbc', validate = False)  # Select solver
-    # solver_manager = SolverManagerFactory('neos')  # Solve in neos server
-    # results = solver_manager.solve(model, opt=opt)
 
-    opt = SolverFactory('cbc')
-    results = opt.solve(model)  # Solve locally
+def elastic_violations(model, faculty_all, students_all):
+    """
+    Lists what a solved elastic model (see build_model) had to violate:
+    missing interviews of each student and interviews at unavailable times
+    Returns: list of descriptions
+    """
+    violations = []
+    for stu in model.missed:
+        missed = round(model.missed[stu].value or 0)
+        if missed:
+            violations.append(f"Quota: {students_all[stu]['name']} ({stu}) misses {missed} of "
+                              f"{interview_number} interviews")
+    for fac, stu, time in solution_matrix(model):
+        for person, people in [(fac, faculty_all), (stu, students_all)]:
+            if time in people[person]["avail"]["no"]:
+                violations.append(f"Availability: {people[person]['name']} ({person}) is not available at "
+                                  f"time {time}, interview of {faculty_all[fac]['name']} with "
+                                  f"{students_all[stu]['name']}")
+    return violations
+
+
+def lp_draft_matrix(model, times_all, faculty_all, students_all):
+    """
+    Draft schedule in seconds: solves the LP relaxation of the model, rounds it
+    (heuristics.randomized_rounding) and reports the LP bound, which no schedule
+    can beat, so the gap of the draft is known without a branch-and-bound run.
+    Returns: list of (fac, stu, time)
+    """
+    import heuristics
+    relaxed = TransformationFactory('core.relax_integer_vars').create_using(model)
+    results = solve_model(relaxed)
+    if is_infeasible(results):
+        print("LP relaxation infeasible, falling back to the quick draft")
+        return heuristics.quick_draft(times_all, faculty_all, students_all)
+
+    bound = value(relaxed.obj)
+    fractional = {slot: relaxed.grid[slot].value or 0 for slot in relaxed.grid}
+    matrix = heuristics.randomized_rounding(times_all, faculty_all, students_all, fractional)
+    total = objective_parts(matrix, times_all, faculty_all, students_all)["total"]
+    print(f"LP draft: {len(matrix)} interviews, objective {total}, LP bound {bound:.1f}, "
+          f"gap {100 * (bound - total) / max(abs(bound), 1):.1f}%")
+    return matrix
+
 
-    print(results)
+def persistent_model(times_all, faculty_all, students_all, backend=persistent_backend):
+    """
+    Model kept in a persistent solver for "what if" questions on the weights:
+    build it once, then call resolve with the changed weights.
+    Returns: session dictionary (model, solver, solved)
+    """
+    model = build_model(times_all, faculty_all, students_all, mutable=True)
+    return {"model": model, "solver": solvers.persistent(backend, backend_options.get(backend)), "solved": False}
 
+
+def resolve(session, changes=None):
+    """
+    Changes weights of a persistent model (see persistent_model) and solves it again,
+    starting from the previous solution. Nothing is rebuilt, the solver only gets
+    the new coefficients.
+    Input: session, dictionary of new values, key=one of mutable_weights or "max_faculty_interview"
+    Returns: list of (fac, stu, time)
+    """
+    model = session["model"]
+    check_weights(changes or {})
+    for key, new in (changes or {}).items():
+        if key == "max_faculty_interview":
+            model.max_interviews = new
+        else:
+            model.weight[key] = new
+
+    results = solvers.solve_persistent(session["solver"], model, warmstart=session["solved"])
+    if not session["solved"]:
+        solvers.keep_structure(session["solver"])
+        session["solved"] = True
+    print(f"{changes or 'Initial weights'}: {solvers.summary(results)}")
+    return solution_matrix(model)
+
+
+def solve_mip(model, times_all, start=None, rows=None, progress=None):
+    """
+    Solves the model, from the start schedule if there is one,
+    with the solver portfolio if one is configured, otherwise within time_limit
+    and saving rows(model) to the checkpoint file if one is configured.
+    Progress is reported during the solve, except for the portfolio.
+    Returns: solver results
+    """
+    if start:
+        n = set_start(model, start, times_all)
+        print(f"MIP start: {n} of {len(start)} interviews")
+    if portfolio:
+        return solve_portfolio(model, times_all, portfolio, portfolio_deadline, warmstart=bool(start))
+    if checkpoint:
+        return solvers.solve_checkpointed(model, backend, backend_options.get(backend), checkpoint, time_limit,
+                                          checkpoint_interval, warmstart=bool(start), rows=rows or solution_matrix,
+                                          progress=progress)
+    return solve_model(model, warmstart=bool(start), progress=progress)
+
+
+def _portfolio_worker(model, index, name, options, time_limit, warmstart, queue):
+    """
+    Solves the model inherited from the parent process with one solver setting
+    and sends back (index, result, schedule). Backends without a time limit
+    option are stopped by the parent at the deadline.
+    """
+    os.setpgrp()  # The solver process joins this group, so the parent can stop both
+    if name in solvers.time_limit_options:
+        options = dict(options, **{solvers.time_limit_options[name]: time_limit})
+    results = solvers.solve(model, name, options, warmstart=warmstart)
+    matrix = solution_matrix(model) if results["objective"] is not None else []
+    queue.put((index, results, matrix))
+
+
+def solve_portfolio(model, times_all, settings, deadline, warmstart=False):
+    """
+    Solves the same model with several solver settings in parallel processes.
+    The model is built once and inherited by the forked workers. The first
+    proof of optimality wins and stops the others, otherwise the best incumbent
+    found by the deadline is kept. The schedule is loaded back into the model.
+    Input: model, times, list of (backend, options), deadline in seconds
+    Returns: result dictionary of the kept solve
+    """
+    settings = [(name, options) for name, options in settings if solvers.available(name)]
+    if not settings:
+        print(f"Portfolio: no solver available, solving with {backend} alone")
+        return solve_model(model, warmstart=warmstart)
+
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    workers = [context.Process(target=_portfolio_worker,
+                               args=(model, i, name, options, deadline, warmstart, queue))
+               for i, (name, options) in enumerate(settings)]
+    for worker in workers:
+        worker.start()
+
+    start_time = time_module.time()
+    best, last, received = None, None, 0
+    try:
+        while received < len(workers):
+            # Solvers with a time limit stop at the deadline, give them a minute to report
+            remaining = deadline + 60 - (time_module.time() - start_time)
+            try:
+                index, results, matrix = queue.get(timeout=max(remaining, 1))
+            except Empty:
+                break
+            received += 1
+            print(f"Portfolio: {settings[index][1]} {solvers.summary(results)}")
+            last = results
+            if results["objective"] is not None and (best is None or results["objective"] > best[1]["objective"]):
+                best = (index, results, matrix)
+            if results["status"] == "optimal":
+                break
+    finally:
+        # The workers left the terminal's process group, so an interrupt does not reach them
+        for worker in workers:
+            if worker.is_alive():
+                try:
+                    os.killpg(worker.pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    worker.terminate()
+            worker.join(10)
+            if worker.is_alive():
+                try:
+                    os.killpg(worker.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    worker.kill()
+                worker.join()
+
+    if best is None:
+        if last is None:
+            print(f"Portfolio: no solver answered, solving with {backend} alone")
+            return solve_model(model, warmstart=warmstart)
+        print("Portfolio: no schedule found")
+        return last
+    index, results, matrix = best
+    print(f"Portfolio: keeping {settings[index][0]} {settings[index][1]}, objective {results['objective']}")
+    set_start(model, matrix, times_all)
+    return results
+
+
+def objective_parts(matrix, times_all, faculty_all, students_all):
+    """
+    Evaluates a schedule with the objective of the model
+    Returns: dictionary of objective parts and total
+    """
+    person_times = defaultdict(list)
+    for fac, stu, time in matrix:
+        person_times[fac].append(time)
+        person_times[stu].append(time)
+
+    parts = {"matching": sum(students_all[stu]["match"][fac] for fac, stu, time in matrix),
+             "maybe": sum((time in faculty_all[fac]["avail"]["maybe"]) + (time in students_all[stu]["avail"]["maybe"])
+                          for fac, stu, time in matrix),
+             "consecutive": sum(consecutives(times_all, person_times[person]) for person in person_times),
+             "block": sum(len(set(times_all[time]["time block"] for time in person_times[fac]))
+                          for fac in faculty_all if fac in person_times)}
+    parts["total"] = parts["matching"] + weights["maybe available"] * parts["maybe"] \
+        + weights["consecutive"] * parts["consecutive"] + weights["block"] * parts["block"]
+    return parts
+
+
+def solution_matrix(model):
+    """
+    Reads the selected interviews from a solved model
+    Returns: list of (fac, stu, time)
+    """
     matrix = []
     for fac, stu, time in model.grid:
-        if model.grid[fac, stu, time].value:
+        if (model.grid[fac, stu, time].value or 0) > 0.5:
             matrix.append((fac, stu, time))
 
     return matrix
 
 
+def show_changes(changes, faculty, students):
+    print("\nChanges to the previous matrix:")
+    for change, (fac, stu, time) in changes:
+        fac_name = faculty[fac]["name"] if fac in faculty else fac
+        stu_name = students[stu]["name"] if stu in students else stu
+        print(f"{change}: {fac_name} with {stu_name} at time {time}")
+
+
+def schedule(times, faculty, students, previous):
+    """
+    Runs the selected engine, starting from the previous matrix when there is one
+    (or from the checkpoint file for the "mip" engine)
+    Returns: list of (fac, stu, time)
+    """
+    # The engines import this module, so they are only imported when selected
+    if engine == "repair":
+        import heuristics
+        matrix, changes = heuristics.repair(times, faculty, students, previous)
+        show_changes(changes, faculty, students)
+        return matrix
+
+    # Keep what is still valid in the previous matrix
+    previous = clean_previous_matrix(previous, times, faculty, students)
+    # The "mip" engine starts from its last checkpoint rather than from a draft
+    saved = solvers.load_checkpoint(checkpoint) if resume else None
+
+    if engine == "two stage":
+        import decomposition
+        return decomposition.make_matrix_two_stage(times, faculty, students)
+    elif engine == "rolling horizon":
+        import decomposition
+        return decomposition.make_matrix_rolling_horizon(times, faculty, students, workers=workers)
+    elif engine == "clusters":
+        import decomposition
+        return decomposition.make_matrix_clusters(times, faculty, students, workers=workers)
+    elif engine == "direct":
+        import direct_model
+        return direct_model.make_matrix_direct(times, faculty, students)
+    elif engine == "draft":
+        import heuristics
+        return heuristics.quick_draft(times, faculty, students, previous)
+    elif engine == "column generation":
+        import colgen
+        return colgen.make_matrix_column_generation(times, faculty, students)
+    elif engine == "lp draft":
+        return make_matrix(times, faculty, students, lp_draft=True)
+    elif engine == "anneal":
+        import heuristics
+        matrix, history = heuristics.anneal(times, faculty, students, anneal_budget, previous)
+        return matrix
+    elif saved:
+        print(f"\nResuming from the checkpoint of {saved['saved']}: objective {saved['objective']}, "
+              f"bound {saved['bound']}")
+        return make_matrix(times, faculty, students, start=clean_previous_matrix(saved["rows"], times, faculty, students))
+    elif warm_start or previous:
+        import heuristics
+        return make_matrix(times, faculty, students, start=heuristics.quick_draft(times, faculty, students, previous))
+    else:
+        return make_matrix(times, faculty, students)
+
+
+def matrix_stats(matrix, times, faculty, students):
+    """
+    Summary figures of a schedule, as printed by matrix_analysis
+    Returns: dictionary of figures, with the objective parts (see objective_parts)
+    """
+    stats = objective_parts(matrix, times, faculty, students)
+    by_stu, by_fac = defaultdict(list), defaultdict(list)
+    for fac, stu, time in matrix:
+        by_stu[stu].append(students[stu]["match"][fac])
+        by_fac[fac].append(students[stu]["match"][fac])
+    stats["interviews"] = len(matrix)
+    stats["score per candidate"] = sum(map(sum, by_stu.values())) / max(interview_number * len(by_stu), 1)
+    stats["score per faculty"] = sum(sum(s) / len(s) for s in by_fac.values()) / max(len(by_fac), 1)
+    stats["faculty without interviews"] = len([fac for fac in faculty if fac not in by_fac])
+    stats["students short"] = len([stu for stu in students if len(by_stu[stu]) < interview_number])
+    return stats
+
+
 def matrix_analysis(matrix_original, faculty, students, times):
     matrix = defaultdict(list)
     for fac, stu, time in matrix_original:
@@ -630,12 +1485,12 @@ def matrix_analysis(matrix_original, faculty, students, times):
         times_an["times"][fac].append(time)
     print("By faculty:")
     for f in faculty:
-        consec = consecutives(times_an["times"][f])
+        consec = consecutives(times, times_an["times"][f])
         if consec:
             print(faculty[f]["name"], "has", consec," consecutive interviews")
     print("\nBy students:")
     for s in students:
-        consec = consecutives(times_an["times"][s])
+        consec = consecutives(times, times_an["times"][s])
         if consec:
             print(students[s]["name"], "has", consec," consecutive interviews")
 
@@ -684,7 +1539,11 @@ def export_matrix(db, matrix):
     db.commit()
 
 
-if __name__ == "__main__":
+def connect():
+    """
+    Connects to the selection and matrix databases
+    Returns: (selection database connection, matrix database connection)
+    """
     login = toml.load("login.toml")
     # selection_db = pymysql.connect(host=login["aad"]["host"],
     #                                user=login["aad"]["username"],
@@ -699,7 +1558,16 @@ if __name__ == "__main__":
                                 user="root",
                                 passwd="",
                                 db="aws_feb22")
+    return (selection_db, matrix_db)
 
+
+def load_inputs(selection_db, matrix_db, read_only=False):
+    """
+    Reads and prepares everything the engines need, with the special cases of this year.
+    With read_only, nothing is written to the databases (the matrix table is not cleared).
+    Closes the selection database connection.
+    Returns: (times, faculty, students, previous matrix)
+    """
     # Faculty information
     faculty = get_faculty(selection_db, matrix_db, faculty_sql, faculty_fields_sql)
 
@@ -709,8 +1577,10 @@ if __name__ == "__main__":
 
     # Time slots
     time_blocks, times = get_times(matrix_db)
+    # Previous matrix (must be read before the table is cleared)
+    previous = get_previous_matrix(matrix_db) if resume else []
     # Add availabilities
-    (faculty, students) = add_availability_and_check(matrix_db, faculty, students, times, time_blocks)
+    (faculty, students) = add_availability_and_check(matrix_db, faculty, students, times, time_blocks, read_only)
     # Show comments
     show_comments(students)
     # Manually modifying faculty of interest
@@ -744,8 +1614,31 @@ if __name__ == "__main__":
     # students = {s:students[s] for i, s in enumerate(students) if i <= 10}
     # faculty = {s:faculty[s] for i, s in enumerate(faculty) if i <= 10}
 
+    return (times, faculty, students, previous)
+
+
+if __name__ == "__main__":
+    # The engines import this module by name, make them share this run's settings
+    sys.modules["aws_online_matrix"] = sys.modules[__name__]
+    import feasibility
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=solvers.backends, default=backend, help="Solver backend")
+    parser.add_argument("--checkpoint", default=checkpoint, help="File keeping the best schedule during the solve")
+    parser.add_argument("--time-limit", type=float, default=time_limit, help="Seconds of solve with checkpoints")
+    args = parser.parse_args()
+    backend, checkpoint, time_limit = args.backend, args.checkpoint, args.time_limit
+
+    selection_db, matrix_db = connect()
+    times, faculty, students, previous = load_inputs(selection_db, matrix_db)
+
+    # Stop before building any model if no schedule can exist, elastic mode reports instead
+    if not feasibility.check(times, faculty, students) and not elastic:
+        matrix_db.close()
+        raise SystemExit("Fix the data above before making the matrix")
+
     # Make matrix
-    matrix = make_matrix(times, faculty, students)
+    matrix = schedule(times, faculty, students, previous)
     # Export data
     export_matrix(matrix_db, matrix)
     # Analyze stats
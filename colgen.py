@@ -0,0 +1,206 @@
+import aws_online_matrix as aws
+import heuristics
+import time as time_module
+from collections import defaultdict
+from scipy.optimize import linprog, milp, Bounds, LinearConstraint
+from scipy.sparse import coo_matrix
+
+
+def student_candidates(times_all, faculty_all, students_all):
+    """
+    Feasible interviews of each student with their objective coefficient
+    Returns: dictionary of lists of (time, fac, coefficient), key=student ID
+    """
+    slots = aws.interview_slots(times_all, faculty_all, students_all)
+    coefficients = aws.interview_coefficients(slots, faculty_all, students_all)
+    candidates = defaultdict(list)
+    for fac, stu, time in slots:
+        candidates[stu].append((time, fac, coefficients[fac, stu, time]))
+    return candidates
+
+
+def column_value(column, times_all, coefficients):
+    """
+    Objective of one student's schedule: coefficients plus the student's consecutive interviews
+    """
+    return sum(coefficients[fac, time] for fac, time in column) \
+        + aws.weights["consecutive"] * aws.consecutives(times_all, [time for fac, time in column])
+
+
+def price_student(times_all, candidates, reduced, ordered, beam=20):
+    """
+    Pricing problem of one student: best set of interview_number non-overlapping
+    interviews with distinct faculty for the reduced coefficients.
+    Dynamic programming over times sorted by start, keeping the `beam` best partial
+    schedules for each number of interviews, so it is exact only for large beams.
+    Input: times, list of (time, fac, coefficient), dictionary of reduced coefficients
+           key=(fac, time), list of times sorted by start
+    Returns: (reduced value, list of (fac, time)) of the best schedule found, or None
+    """
+    n = aws.interview_number
+    by_time = defaultdict(list)
+    for time, fac, _ in candidates:
+        by_time[time].append((reduced[fac, time], fac))
+    # Only the n best faculty of a time can be part of an optimal schedule
+    by_time = {time: sorted(by_time[time], reverse=True)[:n] for time in by_time}
+
+    ends = sorted(by_time, key=lambda t: times_all[t]["to"])
+    paths = defaultdict(list)  # paths[c]: partial schedules of c interviews ending before the current time
+    ending = defaultdict(list)  # ending[time]: partial schedules whose last interview is at time
+    released = 0
+    best = None
+    for time in [t for t in ordered if t in by_time]:
+        start = times_all[time]["from"]
+        while released < len(ends) and times_all[ends[released]]["to"] + aws.interview_break <= start:
+            for count, value, column in ending[ends[released]]:
+                paths[count].append((value, column))
+            released += 1
+        for count in paths:
+            paths[count] = sorted(paths[count], key=lambda path: -path[0])[:beam]
+
+        extended = []
+        for value, fac in by_time[time]:
+            extended.append((1, value, ((fac, time),)))
+            for count in range(1, n):
+                for path_value, column in paths[count]:
+                    if any(f == fac for f, _ in column):
+                        continue
+                    previous = column[-1][1]
+                    bonus = aws.weights["consecutive"] * (times_all[previous]["to"] + aws.interview_break == start)
+                    extended.append((count + 1, path_value + value + bonus, column + ((fac, time),)))
+        for count, value, column in extended:
+            if count == n:
+                if best is None or value > best[0]:
+                    best = (value, list(column))
+            else:
+                ending[time].append((count, value, column))
+        ending[time] = sorted(ending[time], key=lambda path: -path[1])[:beam * n]
+
+    return best
+
+
+def solve_master(columns, values, faculty_rows, n_students, integer=False, time_limit=None):
+    """
+    Master problem over the generated columns: one column per student, faculty capacity
+    and at most one interview per faculty and clique of overlapping times
+    Input: list of (student index, list of row indices), column values, number of
+           faculty rows and their right-hand sides, number of students
+    Returns: scipy result
+    """
+    rows, cols = [], []
+    eq_rows, eq_cols = [], []
+    for j, (stu, column_rows) in enumerate(columns):
+        eq_rows.append(stu)
+        eq_cols.append(j)
+        for row in column_rows:
+            rows.append(row)
+            cols.append(j)
+    a_ub = coo_matrix(([1] * len(rows), (rows, cols)), shape=(len(faculty_rows), len(columns))).tocsr()
+    a_eq = coo_matrix(([1] * len(eq_rows), (eq_rows, eq_cols)), shape=(n_students, len(columns))).tocsr()
+    cost = [-value for value in values]
+
+    if integer:
+        constraints = [LinearConstraint(a_ub, ub=faculty_rows), LinearConstraint(a_eq, lb=1, ub=1)]
+        options = {"time_limit": time_limit} if time_limit else {}
+        return milp(cost, constraints=constraints, integrality=[1] * len(columns),
+                    bounds=Bounds(0, 1), options=options)
+    return linprog(cost, A_ub=a_ub, b_ub=faculty_rows, A_eq=a_eq, b_eq=[1] * n_students,
+                   bounds=(0, 1), method="highs")
+
+
+def make_matrix_column_generation(times_all, faculty_all, students_all, max_iterations=100,
+                                  time_limit=600, beam=20):
+    """
+    Alternative engine where each column is a complete schedule for one student.
+    The master LP handles faculty capacity and faculty overlaps, each student's pricing
+    problem builds new schedules from the duals (price_student), and the final schedule
+    is the integer master over all generated columns (price-and-branch).
+    The master only sees the student side of the consecutive term: faculty consecutive
+    interviews and time blocks are not optimized by this engine.
+    Returns: list of (fac, stu, time)
+    """
+    start_time = time_module.time()
+    students = list(students_all)
+    cliques, _ = aws.get_conflicts(times_all)
+    time_cliques = defaultdict(list)
+    for q, clique in enumerate(cliques):
+        for time in clique:
+            time_cliques[time].append(q)
+    ordered = sorted(times_all, key=lambda t: times_all[t]["from"])
+
+    # Rows: faculty capacity, then (faculty, clique)
+    row_index = {fac: i for i, fac in enumerate(faculty_all)}
+    faculty_rows = [aws.max_faculty_interview] * len(row_index)
+
+    def rows_of(column):
+        indices = []
+        for fac, time in column:
+            indices.append(row_index[fac])
+            for q in time_cliques[time]:
+                if (fac, q) not in row_index:
+                    row_index[fac, q] = len(faculty_rows)
+                    faculty_rows.append(1)
+                indices.append(row_index[fac, q])
+        return indices
+
+    candidates = student_candidates(times_all, faculty_all, students_all)
+    coefficients = {stu: {(fac, time): c for time, fac, c in candidates[stu]} for stu in students}
+
+    # Initial columns from the quick draft. Short schedules are kept so the master
+    # stays feasible, with a penalty larger than any interview is worth
+    penalty = 10 * max([abs(c) for stu in students for c in coefficients[stu].values()] + [1])
+    draft = heuristics.quick_draft(times_all, faculty_all, students_all)
+    draft_columns = defaultdict(list)
+    for fac, stu, time in draft:
+        draft_columns[stu].append((fac, time))
+    columns, values, schedules = [], [], []
+    for i, stu in enumerate(students):
+        column = draft_columns[stu]
+        columns.append((i, rows_of(column)))
+        values.append(column_value(column, times_all, coefficients[stu])
+                      - penalty * (aws.interview_number - len(column)))
+        schedules.append(column)
+
+    lp_value = None
+    for iteration in range(max_iterations):
+        result = solve_master(columns, values, faculty_rows, len(students))
+        lp_value = -result.fun
+        duals = [-y for y in result.ineqlin.marginals]
+        convexity = [-y for y in result.eqlin.marginals]
+
+        added = 0
+        for i, stu in enumerate(students):
+            reduced = {}
+            for time, fac, c in candidates[stu]:
+                # Rows added during this round have no dual yet
+                reduced[fac, time] = c - duals[row_index[fac]] \
+                    - sum(duals[row_index[fac, q]] for q in time_cliques[time]
+                          if row_index.get((fac, q), len(duals)) < len(duals))
+            best = price_student(times_all, candidates[stu], reduced, ordered, beam)
+            if best is not None and best[0] - convexity[i] > 1e-6:
+                columns.append((i, rows_of(best[1])))
+                values.append(column_value(best[1], times_all, coefficients[stu]))
+                schedules.append(best[1])
+                added += 1
+
+        elapsed = time_module.time() - start_time
+        print(f"Column generation {iteration + 1}: restricted LP {lp_value:.1f}, {added} columns added, "
+              f"{len(columns)} columns, {elapsed:.0f}s")
+        if not added or elapsed > time_limit / 2:
+            break
+
+    # Price-and-branch: integer master over the generated columns
+    result = solve_master(columns, values, faculty_rows, len(students), integer=True,
+                          time_limit=max(time_limit - (time_module.time() - start_time), 1))
+    if result.x is None:
+        print("Column generation: no integer solution found, keeping the quick draft")
+        return draft
+    # Beam pricing can miss improving columns, so this is not a bound on the full problem
+    print(f"Column generation: integer master {-result.fun:.1f}, restricted LP value {lp_value:.1f}")
+
+    matrix = []
+    for j, x in enumerate(result.x):
+        if x > 0.5:
+            stu = students[columns[j][0]]
+            matrix.extend((fac, stu, time) for fac, time in schedules[j])
+    return matrix
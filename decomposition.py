@@ -0,0 +1,418 @@
+import aws_online_matrix as aws
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import os
+from pyomo.environ import *
+
+
+def pair_scores(times_all, faculty_all, students_all):
+    """
+    Best objective coefficient of each (fac, stu) pair over their common available times
+    Returns: dictionary of scores, key=(fac, stu)
+    """
+    slots = aws.interview_slots(times_all, faculty_all, students_all)
+    coefficients = aws.interview_coefficients(slots, faculty_all, students_all)
+    scores = {}
+    for (fac, stu, time), coefficient in coefficients.items():
+        scores[fac, stu] = max(scores.get((fac, stu), coefficient), coefficient)
+    return scores
+
+
+def faculty_capacity(times_all, faculty_all):
+    """
+    Interviews each faculty can take: the global maximum, or fewer if their
+    available times cannot hold that many non-overlapping interviews
+    Returns: dictionary of capacities, key=faculty ID
+    """
+    capacity = {}
+    for fac in faculty_all:
+        no = set(faculty_all[fac]["avail"]["no"])
+        available = [t for t in times_all if t not in no]
+        capacity[fac] = min(aws.max_faculty_interview, aws.non_overlapping_count(times_all, available))
+    return capacity
+
+
+def assign_pairs(scores, faculty_all, students_all, capacity, cuts):
+    """
+    Stage 1: chooses which faculty each student meets (b-matching on the pair scores).
+    The constraint matrix is totally unimodular, so the solver answers at the root node.
+    Input: pair scores, faculty and student dictionnaries, faculty capacities,
+           set of (fac, stu) pairs the timing stage could not place
+    Returns: list of (fac, stu), or None if no assignment exists
+    """
+    model = ConcreteModel()
+    model.pair = Var([pair for pair in scores if pair not in cuts], within=Binary, initialize=0)
+
+    by_stu, by_fac = defaultdict(list), defaultdict(list)
+    for fac, stu in model.pair:
+        by_stu[stu].append(model.pair[fac, stu])
+        by_fac[fac].append(model.pair[fac, stu])
+
+    model.obj = Objective(expr=quicksum(scores[pair] * model.pair[pair] for pair in model.pair), sense=maximize)
+    model.student_quota = Constraint(list(by_stu), rule=lambda m, stu: sum(by_stu[stu]) == aws.interview_number)
+    model.faculty_capacity = Constraint(list(by_fac), rule=lambda m, fac: sum(by_fac[fac]) <= capacity[fac])
+
+    results = aws.solve_model(model)
+    if aws.is_infeasible(results):
+        return None
+
+    return [pair for pair in model.pair if (model.pair[pair].value or 0) > 0.5]
+
+
+def place_pairs(times_all, faculty_all, students_all, pairs):
+    """
+    Stage 2: schedules the chosen pairs into time slots with the full objective.
+    The solver places as many pairs as possible first (see solve_placement), from the
+    greedy placement, instead of failing when some cannot fit. If it stops before proving
+    that no more pairs fit, the pairs left out are placed greedily where they still fit.
+    Returns: (list of (fac, stu, time), list of (fac, stu) pairs that could not be placed,
+              True if the solver proved that these pairs cannot all be placed)
+    """
+    import heuristics
+    candidates = defaultdict(set)
+    for fac, stu in pairs:
+        candidates[stu].add(fac)
+    model = aws.build_model(times_all, faculty_all, students_all, candidates=candidates, partial=True)
+
+    # Placing pairs becomes the first objective, each pair at most once
+    model.student_quota.deactivate()
+    by_pair = defaultdict(list)
+    for fac, stu, time in model.grid:
+        by_pair[fac, stu].append(model.grid[fac, stu, time])
+    model.pair_placed = Constraint(list(by_pair), rule=lambda m, fac, stu: sum(by_pair[fac, stu]) <= 1)
+
+    start, _ = heuristics.greedy_placement(times_all, faculty_all, students_all, pairs)
+    placement, results = solve_placement(model, times_all, start)
+    matrix = aws.solution_matrix(model)
+    placed = set((fac, stu) for fac, stu, time in matrix)
+    unplaced = [pair for pair in pairs if pair not in placed]
+
+    proven = placement["status"] == "optimal"
+    if unplaced and not proven:
+        print(f"Placement stopped ({placement['status']}) with {len(unplaced)} pairs left, placing them greedily")
+        matrix, unplaced = heuristics.greedy_placement(times_all, faculty_all, students_all, unplaced, matrix)
+    return (matrix, unplaced, proven)
+
+
+def solve_placement(model, times_all, start=()):
+    """
+    Solves a model built by build_model without student quotas in two phases: the most
+    interviews that can be placed, then the objective of the model with that many
+    interviews. The objective is never scaled by a placement weight, so the gap
+    tolerance of the solver applies to the objective itself.
+    The start schedule (list of (fac, stu, time)) is the MIP start of the first phase.
+    If a phase finds nothing, the model keeps the values of the previous one.
+    Returns: (result of the placement phase, result of the objective phase)
+             (see solvers.make_result)
+    """
+    if start:
+        aws.set_start(model, start, times_all)
+    model.obj.deactivate()
+    model.placement_obj = Objective(expr=quicksum(model.grid.values()), sense=maximize)
+    placement = aws.solve_model(model, warmstart=bool(start))
+
+    placed = len(aws.solution_matrix(model))
+    model.placement_obj.deactivate()
+    model.obj.activate()
+    model.placement_count = Constraint(expr=quicksum(model.grid.values()) >= placed)
+    results = aws.solve_model(model, warmstart=True)
+    return (placement, results)
+
+
+def make_matrix_two_stage(times_all, faculty_all, students_all, max_rounds=10):
+    """
+    Alternative engine to aws_online_matrix.make_matrix: assigns (fac, stu) pairs first,
+    then schedules them. Pairs the timing stage proves it cannot place are cut from the
+    first stage and the assignment is solved again.
+    Returns: list of (fac, stu, time)
+    """
+    scores = pair_scores(times_all, faculty_all, students_all)
+    capacity = faculty_capacity(times_all, faculty_all)
+
+    for stu in students_all:
+        if not any((fac, stu) in scores for fac in faculty_all):
+            print(f"WARNING: Student {stu} has no available time slot with any faculty")
+
+    cuts = set()
+    best = []
+    for n in range(max_rounds):
+        pairs = assign_pairs(scores, faculty_all, students_all, capacity, cuts)
+        if pairs is None:
+            print("Two-stage: no pair assignment left, keeping the best schedule so far")
+            break
+
+        matrix, unplaced, proven = place_pairs(times_all, faculty_all, students_all, pairs)
+        print(f"Two-stage round {n + 1}: {len(pairs)} pairs assigned, {len(unplaced)} could not be placed")
+        if len(matrix) > len(best):
+            best = matrix
+        if not unplaced:
+            break
+        if not proven:
+            # Pairs are only cut when the solver proved they cannot be placed
+            print("Two-stage: placement not proven, completing the students left short with the quick draft")
+            import heuristics
+            return heuristics.quick_draft(times_all, faculty_all, students_all, best)
+        cuts.update(unplaced)
+
+    return best
+
+
+def horizons(times_all, by_day=False):
+    """
+    Groups the times into horizons solved one at a time: time blocks, or days
+    Returns: dictionary of times dictionnaries, key=block ID or date
+    """
+    groups = defaultdict(dict)
+    for time in times_all:
+        key = times_all[time]["from"].date() if by_day else times_all[time]["time block"]
+        groups[key][time] = times_all[time]
+    return dict(groups)
+
+
+def split_by_horizon(groups, faculty_all, students_all):
+    """
+    Fixes the quotas up front: chooses in which horizon each (fac, stu) pair meets.
+    Each person gets no more interviews in a horizon than its available times there
+    can hold without overlap, and each faculty pays the block weight once per horizon used.
+    Returns: dictionary of lists of (fac, stu), key=horizon, or None if no split exists
+    """
+    scores, limits = {}, {}
+    for key, times in groups.items():
+        for (fac, stu), score in pair_scores(times, faculty_all, students_all).items():
+            scores[fac, stu, key] = score
+        for person, avail in [(fac, faculty_all[fac]["avail"]) for fac in faculty_all] \
+                + [(stu, students_all[stu]["avail"]) for stu in students_all]:
+            no = set(avail["no"])
+            limits[person, key] = aws.non_overlapping_count(times, [t for t in times if t not in no])
+    capacity = faculty_capacity({t: time for times in groups.values() for t, time in times.items()}, faculty_all)
+
+    model = ConcreteModel()
+    model.pair = Var(list(scores), within=Binary, initialize=0)
+    by_stu, by_fac, by_pair = defaultdict(list), defaultdict(list), defaultdict(list)
+    by_person_horizon = defaultdict(list)
+    for fac, stu, key in model.pair:
+        var = model.pair[fac, stu, key]
+        by_stu[stu].append(var)
+        by_fac[fac].append(var)
+        by_pair[fac, stu].append(var)
+        by_person_horizon[fac, key].append(var)
+        by_person_horizon[stu, key].append(var)
+    fac_horizons = [(fac, key) for fac in faculty_all for key in groups if (fac, key) in by_person_horizon]
+    model.fac_horizon = Var(fac_horizons, within=Binary, initialize=0)
+
+    model.obj = Objective(expr=quicksum(scores[index] * model.pair[index] for index in model.pair)
+                          + aws.weights["block"] * quicksum(model.fac_horizon.values()), sense=maximize)
+    model.student_quota = Constraint(list(by_stu), rule=lambda m, stu: sum(by_stu[stu]) == aws.interview_number)
+    model.faculty_capacity = Constraint(list(by_fac), rule=lambda m, fac: sum(by_fac[fac]) <= capacity[fac])
+    model.pair_once = Constraint(list(by_pair), rule=lambda m, fac, stu: sum(by_pair[fac, stu]) <= 1)
+    model.horizon_limit = Constraint(list(by_person_horizon), rule=lambda m, person, key:
+                                     sum(by_person_horizon[person, key]) <= limits[person, key])
+    model.fac_horizon_link = Constraint(fac_horizons, rule=lambda m, fac, key:
+                                        sum(by_person_horizon[fac, key]) <= limits[fac, key] * m.fac_horizon[fac, key])
+
+    results = aws.solve_model(model)
+    if aws.is_infeasible(results):
+        return None
+
+    split = defaultdict(list)
+    for fac, stu, key in model.pair:
+        if (model.pair[fac, stu, key].value or 0) > 0.5:
+            split[key].append((fac, stu))
+    return split
+
+
+def _place_horizon(args):
+    """
+    place_pairs on one horizon, only with the students that have pairs in it.
+    If the solver stopped before proving its placement, the pairs it left out were
+    placed greedily (see place_pairs), the others go to the next horizon or stitching.
+    Input: (horizon, times, faculty and student dictionnaries, list of (fac, stu))
+    """
+    key, times, faculty_all, students_all, pairs = args
+    if not pairs:
+        return ([], [])
+    students = {stu: students_all[stu] for fac, stu in pairs}
+    matrix, unplaced, proven = place_pairs(times, faculty_all, students, pairs)
+    if not proven:
+        print(f"WARNING: Rolling horizon {key}: placement not proven, {len(matrix)} of {len(pairs)} pairs "
+              f"placed with the greedy fallback")
+    return (matrix, unplaced)
+
+
+def stitch(times_all, faculty_all, students_all, matrix):
+    """
+    Joins the horizon schedules: drops interviews overlapping an interview of the
+    same person in another horizon (horizons may touch), then completes the
+    students left short with the quick draft over the whole workshop.
+    Returns: list of (fac, stu, time)
+    """
+    import heuristics
+    busy = defaultdict(list)
+    kept, dropped = [], 0
+    for fac, stu, time in sorted(matrix, key=lambda slot: times_all[slot[2]]["from"]):
+        if any(aws.times_overlap(times_all, time, other) for other in busy[fac] + busy[stu]):
+            dropped += 1
+            continue
+        kept.append((fac, stu, time))
+        busy[fac].append(time)
+        busy[stu].append(time)
+    if dropped:
+        print(f"Rolling horizon: {dropped} interviews overlapping another horizon dropped")
+    return heuristics.quick_draft(times_all, faculty_all, students_all, kept)
+
+
+def make_matrix_rolling_horizon(times_all, faculty_all, students_all, by_day=False, workers=None):
+    """
+    Alternative engine for long workshops: the quotas of each person in each time block
+    (or day) are fixed up front by split_by_horizon, then each horizon is scheduled on its
+    own, so only one horizon's model is in memory at a time.
+    With one worker the horizons are solved in time order and pairs that did not fit are
+    carried to the next horizon where both are available. Otherwise the horizons are
+    independent and solved in parallel processes (workers=None: one per core).
+    A stitching pass joins the horizons and fills what is left.
+    Returns: list of (fac, stu, time)
+    """
+    groups = horizons(times_all, by_day)
+    split = split_by_horizon(groups, faculty_all, students_all)
+    if split is None:
+        print("Rolling horizon: no split of the quotas, falling back to the single model")
+        return aws.make_matrix(times_all, faculty_all, students_all)
+
+    order = sorted(groups, key=lambda key: min(groups[key][t]["from"] for t in groups[key]))
+    print(f"Rolling horizon: {len(order)} horizons, "
+          f"{', '.join(str(len(split[key])) for key in order)} pairs")
+
+    matrix = []
+    workers = workers or os.cpu_count()
+    if workers > 1:
+        jobs = [(key, groups[key], faculty_all, students_all, split[key]) for key in order]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for key, (placed, unplaced) in zip(order, pool.map(_place_horizon, jobs)):
+                print(f"Rolling horizon {key}: {len(placed)} placed, {len(unplaced)} left to stitching")
+                matrix.extend(placed)
+    else:
+        carried = []
+        for key in order:
+            times = groups[key]
+            movable = [(fac, stu) for fac, stu in carried
+                       if aws.interview_slots(times, {fac: faculty_all[fac]}, {stu: students_all[stu]})]
+            pairs = split[key] + movable
+            placed, unplaced = _place_horizon((key, times, faculty_all, students_all, pairs))
+            carried = [pair for pair in carried if pair not in movable] + unplaced
+            print(f"Rolling horizon {key}: {len(placed)} placed, {len(unplaced)} carried")
+            matrix.extend(placed)
+
+    return stitch(times_all, faculty_all, students_all, matrix)
+
+
+def field_clusters(faculty_all, students_all, threshold=1, max_students=50):
+    """
+    Splits the people into groups that rarely meet: connected components of the graph
+    of (fac, stu) pairs with a matching score of at least threshold.
+    Components with more than max_students students are split again with the next
+    score level as threshold, and small components are packed together up to
+    max_students (first fit decreasing) so each group is worth a process.
+    Every faculty and student is in exactly one group.
+    Returns: list of (list of faculty IDs, list of student IDs)
+    """
+    def components(faculty, students, threshold):
+        parent = {person: person for person in list(faculty) + list(students)}
+
+        def root(person):
+            while parent[person] != person:
+                parent[person] = parent[parent[person]]
+                person = parent[person]
+            return person
+
+        for stu in students:
+            for fac in faculty:
+                if students_all[stu]["match"][fac] >= threshold:
+                    parent[root(fac)] = root(stu)
+        groups = defaultdict(lambda: ([], []))
+        for fac in faculty:
+            groups[root(fac)][0].append(fac)
+        for stu in students:
+            groups[root(stu)][1].append(stu)
+        return list(groups.values())
+
+    def split(faculty, students, threshold):
+        if len(students) <= max_students:
+            return [(faculty, students)]
+        levels = sorted(set(students_all[stu]["match"][fac] for stu in students for fac in faculty
+                            if students_all[stu]["match"][fac] > threshold))
+        if not levels:
+            return [(faculty, students)]
+        return [group for faculty, students in components(faculty, students, levels[0])
+                for group in split(faculty, students, levels[0])]
+
+    groups = [group for faculty, students in components(list(faculty_all), list(students_all), threshold)
+              for group in split(faculty, students, threshold)]
+
+    packed = []
+    for faculty, students in sorted(groups, key=lambda group: -len(group[1])):
+        for bin_faculty, bin_students in packed:
+            if len(bin_students) + len(students) <= max_students:
+                bin_faculty.extend(faculty)
+                bin_students.extend(students)
+                break
+        else:
+            packed.append((list(faculty), list(students)))
+    return packed
+
+
+def _solve_cluster(args):
+    """
+    Schedules one group on its own: each student gets up to interview_number
+    interviews within the group, placing as many as possible from the quick draft.
+    If the solver stops before proving its placement, the quick draft completes
+    the students of the group.
+    Input: (cluster number, times, faculty and student dictionnaries of the group)
+    Returns: list of (fac, stu, time)
+    """
+    import heuristics
+    number, times_all, faculty_all, students_all = args
+    if not faculty_all or not students_all:
+        return []
+    model = aws.build_model(times_all, faculty_all, students_all, partial=True)
+    model.student_quota.deactivate()
+    by_stu = defaultdict(list)
+    for fac, stu, time in model.grid:
+        by_stu[stu].append(model.grid[fac, stu, time])
+    model.student_most = Constraint(list(by_stu), rule=lambda m, stu: sum(by_stu[stu]) <= aws.interview_number)
+    draft = heuristics.quick_draft(times_all, faculty_all, students_all, verbose=False)
+    placement, results = solve_placement(model, times_all, draft)
+    matrix = aws.solution_matrix(model)
+    if placement["status"] != "optimal":
+        print(f"WARNING: Field cluster {number} ({len(faculty_all)}x{len(students_all)}): placement "
+              f"{placement['status']} with {len(matrix)} interviews, completing with the quick draft")
+        matrix = heuristics.quick_draft(times_all, faculty_all, students_all, matrix, verbose=False)
+    return matrix
+
+
+def make_matrix_clusters(times_all, faculty_all, students_all, threshold=1, max_students=50, workers=None):
+    """
+    Alternative engine for workshops with many fields: splits the people into field
+    clusters (field_clusters) and schedules each cluster in its own process
+    (workers=None: one per core, 1: clusters in sequence in this process).
+    Faculty and students are never shared between clusters, so the cluster schedules
+    cannot conflict. The stitching pass fills the students left short with faculty
+    from other clusters.
+    Returns: list of (fac, stu, time)
+    """
+    clusters = field_clusters(faculty_all, students_all, threshold, max_students)
+    print(f"Field clusters: {len(clusters)} clusters of "
+          f"{', '.join(f'{len(f)}x{len(s)}' for f, s in clusters)} faculty x students")
+
+    jobs = [(number, times_all, {fac: faculty_all[fac] for fac in faculty},
+             {stu: students_all[stu] for stu in students}) for number, (faculty, students) in enumerate(clusters)]
+    matrix = []
+    if (workers or os.cpu_count()) > 1:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for placed in pool.map(_solve_cluster, jobs):
+                matrix.extend(placed)
+    else:
+        for job in jobs:
+            matrix.extend(_solve_cluster(job))
+    print(f"Field clusters: {len(matrix)} interviews placed within clusters")
+
+    return stitch(times_all, faculty_all, students_all, matrix)
@@ -0,0 +1,235 @@
+import aws_online_matrix as aws
+import solvers
+import os
+import subprocess
+import tempfile
+import time as time_module
+from collections import defaultdict
+from scipy.optimize import milp, Bounds, LinearConstraint
+from scipy.sparse import coo_matrix
+
+
+def model_columns(times_all, faculty_all, students_all, candidates=None):
+    """
+    Columns of the interview model of aws_online_matrix.build_model, without Pyomo:
+    interviews, faculty time blocks and consecutive indicators
+    Returns: dictionary with the column keys ("grid", fac, stu, time), ("block", fac, block),
+             ("consecutive", person, t1, t2), their costs, upper bounds and integrality,
+             and the column numbers grouped as the rows need them
+    """
+    slots = aws.interview_slots(times_all, faculty_all, students_all, candidates=candidates)
+    coefficients = aws.interview_coefficients(slots, faculty_all, students_all)
+    _, consecutive_pairs = aws.get_conflicts(times_all)
+
+    keys, costs, upper, integer = [], [], [], []
+
+    def add(key, cost, ub, is_integer):
+        keys.append(key)
+        costs.append(cost)
+        upper.append(ub)
+        integer.append(is_integer)
+        return len(keys) - 1
+
+    groups = {name: defaultdict(list) for name in ["stu", "fac", "pair", "fac time", "stu time", "fac block"]}
+    for fac, stu, time in slots:
+        j = add(("grid", fac, stu, time), coefficients[fac, stu, time], 1, 1)
+        groups["stu"][stu].append(j)
+        groups["fac"][fac].append(j)
+        groups["pair"][fac, stu].append(j)
+        groups["fac time"][fac, time].append(j)
+        groups["stu time"][stu, time].append(j)
+        groups["fac block"][fac, times_all[time]["time block"]].append(j)
+
+    blocks = {key: add(("block", *key), aws.weights["block"], 1, 1) for key in groups["fac block"]}
+    consecutive = {}
+    for by_time in [groups["fac time"], groups["stu time"]]:
+        people = set(person for person, _ in by_time)
+        for person in people:
+            for t1, t2 in consecutive_pairs:
+                if (person, t1) in by_time and (person, t2) in by_time:
+                    consecutive[person, t1, t2] = add(("consecutive", person, t1, t2),
+                                                      aws.weights["consecutive"], 1, 0)
+
+    return {"keys": keys, "costs": costs, "upper": upper, "integer": integer, "groups": groups,
+            "blocks": blocks, "consecutive": consecutive}
+
+
+def model_rows(times_all, faculty_all, students_all, columns):
+    """
+    Rows of the interview model, generated one at a time so they can be streamed
+    Yields: (row name, list of (column, coefficient), lower bound or None, upper bound or None)
+    """
+    groups = columns["groups"]
+    cliques, _ = aws.get_conflicts(times_all)
+    block_times = defaultdict(list)
+    for time in times_all:
+        block_times[times_all[time]["time block"]].append(time)
+    block_capacity = {block: min(aws.max_faculty_interview, aws.non_overlapping_count(times_all, block_times[block]))
+                      for block in block_times}
+
+    for stu in students_all:
+        if stu not in groups["stu"]:
+            print(f"WARNING: Student {stu} has no available time slot with any faculty")
+    for stu, js in groups["stu"].items():
+        yield ("student_quota", [(j, 1) for j in js], aws.interview_number, aws.interview_number)
+    for fac, js in groups["fac"].items():
+        if len(js) > aws.max_faculty_interview:
+            yield ("faculty_capacity", [(j, 1) for j in js], None, aws.max_faculty_interview)
+    for pair, js in groups["pair"].items():
+        if len(js) > 1:
+            yield ("pair_once", [(j, 1) for j in js], None, 1)
+    for (fac, block), js in groups["fac block"].items():
+        yield ("fac_block_link", [(j, 1) for j in js] + [(columns["blocks"][fac, block], -block_capacity[block])],
+               None, 0)
+    for (person, t1, t2), j in columns["consecutive"].items():
+        by_time = groups["fac time"] if (person, t1) in groups["fac time"] else groups["stu time"]
+        for t in (t1, t2):
+            yield ("consecutive_link", [(j, 1)] + [(i, -1) for i in by_time[person, t]], None, 0)
+    for name, by_time in [("fac_overlap", groups["fac time"]), ("stu_overlap", groups["stu time"])]:
+        for js in aws.overlap_rows(by_time, cliques).values():
+            yield (name, [(j, 1) for j in js], None, 1)
+
+
+def write_lp(filename, columns, rows):
+    """
+    Streams the model to a file in LP format, one term per line.
+    Columns are named x0, x1, ... in the order of columns["keys"].
+    Returns: number of rows written
+    """
+    n = 0
+    with open(filename, "w") as f:
+        f.write("Maximize\n obj:\n")
+        for j, cost in enumerate(columns["costs"]):
+            if cost:
+                f.write(f" {cost:+.17g} x{j}\n")
+        f.write("Subject To\n")
+        for name, terms, lb, ub in rows:
+            if lb is not None and lb == ub:
+                senses = [("=", lb)]
+            else:
+                senses = ([(">=", lb)] if lb is not None else []) + ([("<=", ub)] if ub is not None else [])
+            for sense, rhs in senses:
+                f.write(f" {name}_{n}:\n")
+                for j, coef in terms:
+                    f.write(f" {coef:+.17g} x{j}\n")
+                f.write(f" {sense} {rhs:.17g}\n")
+                n += 1
+        f.write("Bounds\n")
+        for j, ub in enumerate(columns["upper"]):
+            f.write(f" 0 <= x{j} <= {ub}\n")
+        f.write("Binaries\n")
+        for j, is_integer in enumerate(columns["integer"]):
+            if is_integer:
+                f.write(f" x{j}\n")
+        f.write("End\n")
+    return n
+
+
+def sparse_form(columns, rows):
+    """
+    Collects the rows into an in-memory sparse matrix for scipy
+    Returns: (sparse matrix, row lower bounds, row upper bounds)
+    """
+    row_index, col_index, coefs, lower, upper = [], [], [], [], []
+    for i, (name, terms, lb, ub) in enumerate(rows):
+        for j, coef in terms:
+            row_index.append(i)
+            col_index.append(j)
+            coefs.append(coef)
+        lower.append(-float("inf") if lb is None else lb)
+        upper.append(float("inf") if ub is None else ub)
+    a = coo_matrix((coefs, (row_index, col_index)), shape=(len(lower), len(columns["keys"]))).tocsr()
+    return (a, lower, upper)
+
+
+def solve_highs(columns, rows, options=None):
+    """
+    Solves the model in memory with HiGHS through scipy.optimize.milp
+    Returns: (list of column values or None, result dictionary (see solvers.make_result))
+    """
+    start_time = time_module.time()
+    a, lower, upper = sparse_form(columns, rows)
+    options = {key: option for key, option in (options or {}).items() if option is not None}
+    result = milp([-c for c in columns["costs"]], constraints=[LinearConstraint(a, lower, upper)],
+                  integrality=columns["integer"], bounds=Bounds(0, columns["upper"]), options=options)
+    runtime = time_module.time() - start_time
+
+    if result.status == 2:
+        return (None, solvers.make_result("highs", "infeasible", None, None, runtime))
+    if result.x is None:
+        return (None, solvers.make_result("highs", "no solution", None, None, runtime))
+    bound = getattr(result, "mip_dual_bound", None)
+    bound = -bound if bound is not None else (-result.fun if result.status == 0 else None)
+    return (list(result.x), solvers.make_result("highs", "optimal" if result.status == 0 else "feasible",
+                                                -result.fun, bound, runtime))
+
+
+def solve_cbc(columns, rows, options=None, directory=None):
+    """
+    Streams the model to an LP file and solves it with the CBC executable
+    Options are CBC command line options, e.g. {"threads": 8, "ratioGap": 0.01, "sec": 600}
+    The files go to directory, or to a temporary directory removed afterwards.
+    Returns: (list of column values or None, result dictionary (see solvers.make_result))
+    """
+    if directory is None:
+        with tempfile.TemporaryDirectory() as directory:
+            return solve_cbc(columns, rows, options, directory)
+
+    start_time = time_module.time()
+    model_file = os.path.join(directory, "interviews.lp")
+    solution_file = os.path.join(directory, "interviews.sol")
+    n = write_lp(model_file, columns, rows)
+    print(f"Direct model: {len(columns['keys'])} columns and {n} rows written to {model_file}")
+
+    command = ["cbc", model_file]
+    for key, option in (options or {}).items():
+        if option is not None:
+            command += [key, str(option)]
+    try:
+        subprocess.run(command + ["solve", "solu", solution_file], check=True)
+        with open(solution_file) as f:
+            status = f.readline()
+            values = [0.0] * len(columns["keys"])
+            for line in f:
+                # index (in the order CBC read the columns), name, value, reduced cost
+                fields = line.replace("**", "").split()
+                values[int(fields[1][1:])] = float(fields[2])
+    except (OSError, subprocess.CalledProcessError) as error:
+        print(f"Solver cbc failed: {error}")
+        return (None, solvers.make_result("cbc", "error", None, None, time_module.time() - start_time))
+    runtime = time_module.time() - start_time
+
+    if status.startswith("Infeasible"):
+        return (None, solvers.make_result("cbc", "infeasible", None, None, runtime))
+    if "objective value" not in status:
+        return (None, solvers.make_result("cbc", "no solution", None, None, runtime))
+    # The LP file is a maximization but CBC may report the value of the minimized objective
+    objective = sum(c * x for c, x in zip(columns["costs"], values))
+    optimal = status.startswith("Optimal")
+    return (values, solvers.make_result("cbc", "optimal" if optimal else "feasible", objective,
+                                        objective if optimal else None, runtime))
+
+
+def make_matrix_direct(times_all, faculty_all, students_all, backend=None):
+    """
+    Alternative to aws_online_matrix.make_matrix that never builds Pyomo components:
+    the same model is generated from the data and streamed to an LP file for CBC,
+    or collected in a sparse matrix for HiGHS. Symmetry rows are not generated.
+    Returns: list of (fac, stu, time)
+    """
+    backend = backend or aws.backend
+    columns = model_columns(times_all, faculty_all, students_all)
+    rows = model_rows(times_all, faculty_all, students_all, columns)
+    options = aws.backend_options.get(backend)
+    if backend == "cbc":
+        values, results = solve_cbc(columns, rows, options)
+    else:
+        if backend != "highs":
+            print(f"Direct model: no direct interface to {backend}, solving with highs")
+            options = aws.backend_options.get("highs")
+        values, results = solve_highs(columns, rows, options)
+    print(solvers.summary(results))
+
+    if values is None:
+        return []
+    return [key[1:] for key, x in zip(columns["keys"], values) if key[0] == "grid" and x > 0.5]
@@ -0,0 +1,136 @@
+import aws_online_matrix as aws
+from collections import deque
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import maximum_flow
+
+
+def available_times(times_all, person):
+    no = set(person["avail"]["no"])
+    return set(t for t in times_all if t not in no)
+
+
+def candidate_graph(times_all, faculty_all, students_all):
+    """
+    Faculty each student can meet: a common available time and not hard-excluded
+    Returns: dictionary of lists of faculty IDs, key=student ID
+    """
+    fac_times = {fac: available_times(times_all, faculty_all[fac]) for fac in faculty_all}
+    graph = {}
+    for stu in students_all:
+        stu_times = available_times(times_all, students_all[stu])
+        graph[stu] = [fac for fac in faculty_all if fac_times[fac] & stu_times
+                      and not aws.hard_excluded(students_all, stu, fac)]
+    return graph
+
+
+def hall_violation(graph, capacity, n):
+    """
+    Largest number of interviews when each student wants n, meets a faculty at most
+    once and each faculty takes at most its capacity (maximum flow). If it is short,
+    the students still reachable from the source in the residual graph, with their
+    faculty, are a Hall violator: they need more interviews than their faculty can give.
+    Returns: (maximum number of interviews, list of students, list of faculty)
+    """
+    students = list(graph)
+    faculty = sorted(set(fac for stu in graph for fac in graph[stu]))
+    node = {stu: 1 + i for i, stu in enumerate(students)}
+    node.update({fac: 1 + len(students) + i for i, fac in enumerate(faculty)})
+    sink = 1 + len(students) + len(faculty)
+
+    edges = [(0, node[stu], n) for stu in students]
+    edges += [(node[stu], node[fac], 1) for stu in students for fac in graph[stu]]
+    edges += [(node[fac], sink, capacity[fac]) for fac in faculty]
+    rows, cols, caps = zip(*edges) if edges else ([], [], [])
+    network = csr_matrix((caps, (rows, cols)), shape=(sink + 1, sink + 1), dtype="int32")
+    result = maximum_flow(network, 0, sink)
+    if result.flow_value >= n * len(students):
+        return (result.flow_value, [], [])
+
+    # Residual graph search from the source
+    flow = result.flow.tocsr()
+    residual = (network - flow).tocsr()
+    reached, queue = {0}, deque([0])
+    while queue:
+        u = queue.popleft()
+        for v, r in zip(residual.indices[residual.indptr[u]:residual.indptr[u + 1]],
+                        residual.data[residual.indptr[u]:residual.indptr[u + 1]]):
+            if r > 0 and v not in reached:
+                reached.add(v)
+                queue.append(v)
+    name = {i: person for person, i in node.items()}
+    return (result.flow_value,
+            [name[i] for i in sorted(reached) if 0 < i <= len(students)],
+            [name[i] for i in sorted(reached) if len(students) < i < sink])
+
+
+def analyze(times_all, faculty_all, students_all):
+    """
+    Checks that a schedule can exist before any model is built:
+    counting bounds, non-overlapping available times of each student,
+    faculty each student can meet, and a Hall-type capacity check on that graph.
+    Returns: list of problems, empty if none was found
+    """
+    n = aws.interview_number
+    problems = []
+
+    # Counting bound on the whole workshop
+    capacity = {fac: min(aws.max_faculty_interview,
+                         aws.non_overlapping_count(times_all, available_times(times_all, faculty_all[fac])))
+                for fac in faculty_all}
+    if sum(capacity.values()) < n * len(students_all):
+        problems.append(f"Faculty can give {sum(capacity.values())} interviews in total, "
+                        f"{n} x {len(students_all)} students need {n * len(students_all)}")
+
+    # Each student on their own
+    graph = candidate_graph(times_all, faculty_all, students_all)
+    for stu in students_all:
+        name = students_all[stu].get("name", stu)
+        slots = aws.non_overlapping_count(times_all, available_times(times_all, students_all[stu]))
+        if slots < n:
+            problems.append(f"Student {name} ({stu}) has room for only {slots} non-overlapping interviews")
+        if len(graph[stu]) < n:
+            problems.append(f"Student {name} ({stu}) can only meet {len(graph[stu])} faculty: "
+                            f"{[faculty_all[fac].get('name', fac) for fac in graph[stu]]}")
+
+    # Groups of students whose faculty cannot give them enough interviews
+    flow, students, faculty = hall_violation(graph, capacity, n)
+    if students:
+        # Full faculty give their capacity, the others at most one interview per student
+        limit = sum(capacity[fac] for fac in faculty) \
+            + sum(1 for stu in students for fac in graph[stu] if fac not in faculty)
+        problems.append(f"At most {flow} of {n * len(students_all)} interviews can be given. "
+                        f"These {len(students)} students need {n * len(students)} interviews "
+                        f"but can get at most {limit}, mostly from these faculty:\n"
+                        f"  students: {[students_all[stu].get('name', stu) for stu in students]}\n"
+                        f"  faculty: {[faculty_all[fac].get('name', fac) for fac in faculty]}")
+    return problems
+
+
+def short_students(times_all, faculty_all, students_all):
+    """
+    Students who cannot get a full schedule within the availability:
+    not enough non-overlapping times or faculty, or part of a Hall violator
+    Returns: set of student IDs
+    """
+    n = aws.interview_number
+    capacity = {fac: min(aws.max_faculty_interview,
+                         aws.non_overlapping_count(times_all, available_times(times_all, faculty_all[fac])))
+                for fac in faculty_all}
+    graph = candidate_graph(times_all, faculty_all, students_all)
+    short = set(stu for stu in students_all if len(graph[stu]) < n
+                or aws.non_overlapping_count(times_all, available_times(times_all, students_all[stu])) < n)
+    flow, students, faculty = hall_violation(graph, capacity, n)
+    return short | set(students)
+
+
+def check(times_all, faculty_all, students_all):
+    """
+    Prints the problems found by analyze
+    Returns: True if none was found
+    """
+    problems = analyze(times_all, faculty_all, students_all)
+    if problems:
+        print(f"\nNo schedule is possible with this data ({len(problems)} problems):")
+        for problem in problems:
+            print(problem)
+    return not problems
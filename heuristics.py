@@ -0,0 +1,399 @@
+import aws_online_matrix as aws
+import decomposition
+import math
+import random
+import time as time_module
+from collections import defaultdict
+from scipy.optimize import linprog
+from scipy.sparse import coo_matrix
+
+
+def flow_assignment(scores, faculty_all, students_all, capacity, quota):
+    """
+    Assigns faculty to students as a min-cost flow (students -> pairs -> faculty),
+    solved as an LP whose optimal vertex is integral.
+    Every assigned pair is worth more than any score difference, so students get
+    as many interviews as possible (up to their quota) before scores count.
+    Input: pair scores, faculty and student dictionnaries, faculty capacities, student quotas
+    Returns: list of (fac, stu) sorted by decreasing score
+    """
+    pairs = list(scores)
+    if not pairs:
+        return []
+    students = {stu: i for i, stu in enumerate(students_all)}
+    faculty = {fac: i + len(students) for i, fac in enumerate(faculty_all)}
+
+    rows = [students[stu] for fac, stu in pairs] + [faculty[fac] for fac, stu in pairs]
+    columns = list(range(len(pairs))) * 2
+    a_ub = coo_matrix(([1] * len(rows), (rows, columns)), shape=(len(students) + len(faculty), len(pairs)))
+    b_ub = [quota[stu] for stu in students_all] + [capacity[fac] for fac in faculty_all]
+
+    assigned = 1 + max(scores.values()) - min(scores.values())
+    cost = [-(scores[pair] + assigned) for pair in pairs]
+    result = linprog(cost, A_ub=a_ub.tocsr(), b_ub=b_ub, bounds=(0, 1), method="highs")
+
+    return sorted((pair for pair, x in zip(pairs, result.x) if x > 0.5), key=lambda pair: -scores[pair])
+
+
+def greedy_placement(times_all, faculty_all, students_all, pairs, matrix=()):
+    """
+    Places each pair at the best free time for both sides: "yes" before "maybe",
+    then times in a block the faculty already uses, then earliest start.
+    Interviews already in matrix are kept and block their times.
+    Returns: (list of (fac, stu, time) including matrix, list of (fac, stu) pairs that could not be placed)
+    """
+    busy = defaultdict(list)
+    blocks = defaultdict(set)
+    for fac, stu, time in matrix:
+        busy[fac].append(time)
+        busy[stu].append(time)
+        blocks[fac].add(times_all[time]["time block"])
+
+    matrix, unplaced = list(matrix), []
+    for fac, stu in pairs:
+        no = set(faculty_all[fac]["avail"]["no"]) | set(students_all[stu]["avail"]["no"])
+        free = [(fac, stu, time) for time in times_all if time not in no
+                and not any(aws.times_overlap(times_all, time, other) for other in busy[fac] + busy[stu])]
+        if not free:
+            unplaced.append((fac, stu))
+            continue
+        coefficients = aws.interview_coefficients(free, faculty_all, students_all)
+        fac, stu, time = max(free, key=lambda slot: (coefficients[slot],
+                                                     times_all[slot[2]]["time block"] in blocks[fac],
+                                                     -times_all[slot[2]]["from"].timestamp()))
+        matrix.append((fac, stu, time))
+        busy[fac].append(time)
+        busy[stu].append(time)
+        blocks[fac].add(times_all[time]["time block"])
+
+    return (matrix, unplaced)
+
+
+def quick_draft(times_all, faculty_all, students_all, matrix=(), verbose=True):
+    """
+    Fast schedule without the MIP: flow assignment of pairs, then greedy placement.
+    Students left short (pairs that did not fit) are refilled greedily with the
+    remaining faculty capacity. Usable on its own or as a MIP start.
+    Interviews already in matrix (e.g. a cleaned previous matrix) are kept and completed.
+    Returns: list of (fac, stu, time)
+    """
+    scores = decomposition.pair_scores(times_all, faculty_all, students_all)
+    capacity = decomposition.faculty_capacity(times_all, faculty_all)
+
+    interviews = defaultdict(int)
+    for fac, stu, time in matrix:
+        interviews[fac] += 1
+        interviews[stu] += 1
+    met = set((fac, stu) for fac, stu, time in matrix)
+    scores = {pair: score for pair, score in scores.items() if pair not in met}
+    residual = {fac: max(capacity[fac] - interviews[fac], 0) for fac in faculty_all}
+    quota = {stu: max(aws.interview_number - interviews[stu], 0) for stu in students_all}
+
+    pairs = flow_assignment(scores, faculty_all, students_all, residual, quota)
+    matrix, unplaced = greedy_placement(times_all, faculty_all, students_all, pairs, matrix)
+
+    # Refill: other faculty with capacity left, best score first
+    for fac, stu, time in matrix[len(matrix) - len(pairs) + len(unplaced):]:
+        interviews[fac] += 1
+        interviews[stu] += 1
+    met = set((fac, stu) for fac, stu, time in matrix)
+    for stu in set(stu for fac, stu in unplaced):
+        others = sorted((pair for pair in scores if pair[1] == stu and pair not in met), key=lambda pair: -scores[pair])
+        for fac, _ in others:
+            if interviews[stu] >= aws.interview_number:
+                break
+            if interviews[fac] >= capacity[fac]:
+                continue
+            matrix, missed = greedy_placement(times_all, faculty_all, students_all, [(fac, stu)], matrix)
+            if not missed:
+                interviews[fac] += 1
+                interviews[stu] += 1
+
+    short = [stu for stu in students_all if interviews[stu] < aws.interview_number]
+    if verbose:
+        print(f"Quick draft: {len(matrix)} interviews, {len(short)} students short of {aws.interview_number}")
+    return matrix
+
+
+def randomized_rounding(times_all, faculty_all, students_all, fractional, rounds=20, seed=None):
+    """
+    Rounds a fractional schedule (e.g. the LP relaxation of the model): students in
+    random order draw interviews with probability proportional to their LP value,
+    skipping draws that break a hard constraint, then quick_draft completes the
+    students left short. The best of several rounds is kept.
+    Input: times, faculty and student dictionnaries, dictionary of LP values key=(fac, stu, time)
+    Returns: list of (fac, stu, time)
+    """
+    rng = random.Random(seed)
+    by_stu = defaultdict(list)
+    for (fac, stu, time), x in fractional.items():
+        if x > 1e-6:
+            by_stu[stu].append(((fac, stu, time), x))
+
+    best, best_total = None, None
+    for _ in range(rounds):
+        busy = defaultdict(list)
+        interviews = defaultdict(int)
+        matrix = []
+        for stu in rng.sample(list(students_all), len(students_all)):
+            draws = list(by_stu[stu])
+            met = set()
+            while draws and interviews[stu] < aws.interview_number:
+                i = rng.choices(range(len(draws)), weights=[x for _, x in draws])[0]
+                (fac, stu, time), _ = draws.pop(i)
+                if fac in met or interviews[fac] >= aws.max_faculty_interview \
+                        or any(aws.times_overlap(times_all, time, other) for other in busy[fac] + busy[stu]):
+                    continue
+                matrix.append((fac, stu, time))
+                met.add(fac)
+                busy[fac].append(time)
+                busy[stu].append(time)
+                interviews[fac] += 1
+                interviews[stu] += 1
+
+        matrix = quick_draft(times_all, faculty_all, students_all, matrix, verbose=False)
+        total = aws.objective_parts(matrix, times_all, faculty_all, students_all)["total"]
+        if best is None or total > best_total:
+            best, best_total = matrix, total
+
+    return best
+
+
+def _pair_times(times_all, faculty_all, students_all, fac, stu):
+    no = set(faculty_all[fac]["avail"]["no"]) | set(students_all[stu]["avail"]["no"])
+    return [time for time in times_all if time not in no]
+
+
+def _blockers(state, times_all, person, time, ignore=None):
+    return [slot for slot in state[person] if slot != ignore and aws.times_overlap(times_all, time, slot[2])]
+
+
+def _apply(state, plan, undo=False):
+    """
+    Applies (or undoes) a plan of ("add" | "remove", (fac, stu, time)) changes
+    on the schedule state (interviews of each person)
+    """
+    for change, (fac, stu, time) in (reversed(plan) if undo else plan):
+        if (change == "add") != undo:
+            state[fac].add((fac, stu, time))
+            state[stu].add((fac, stu, time))
+        else:
+            state[fac].remove((fac, stu, time))
+            state[stu].remove((fac, stu, time))
+
+
+def _plan_key(plan, coefficient):
+    """
+    Plans touching fewer existing interviews first, then the best objective change
+    """
+    removed = sum(change == "remove" for change, _ in plan)
+    gain = sum(coefficient(slot) * (1 if change == "add" else -1) for change, slot in plan)
+    return (removed, -gain)
+
+
+def _insertion_plans(state, stu, depth, times_all, faculty_all, students_all, coefficient, exclude):
+    """
+    Ways to give one more interview to a student, within a neighbourhood of the given depth.
+    Depth 0 is a direct insertion. Deeper plans may also move one blocking interview to
+    another time, or eject one interview of the faculty and reinsert its student
+    elsewhere (ejection chain, one level less deep).
+    Returns: list of plans
+    """
+    plans = []
+    met = set(fac for fac, _, _ in state[stu])
+    for fac in faculty_all:
+        if fac in met or fac in exclude or aws.hard_excluded(students_all, stu, fac):
+            continue
+        has_capacity = len(state[fac]) < aws.max_faculty_interview
+        for time in _pair_times(times_all, faculty_all, students_all, fac, stu):
+            stu_blockers = _blockers(state, times_all, stu, time)
+            fac_blockers = _blockers(state, times_all, fac, time)
+            blockers = stu_blockers + fac_blockers
+            if has_capacity and not blockers:
+                plans.append([("add", (fac, stu, time))])
+            elif depth > 0 and has_capacity and len(blockers) == 1:
+                # Move the blocking interview to another time
+                f, s, t = blockers[0]
+                for other in _pair_times(times_all, faculty_all, students_all, f, s):
+                    if other != t and not aws.times_overlap(times_all, time, other) \
+                            and not _blockers(state, times_all, f, other, ignore=(f, s, t)) \
+                            and not _blockers(state, times_all, s, other, ignore=(f, s, t)):
+                        plans.append([("remove", (f, s, t)), ("add", (f, s, other)), ("add", (fac, stu, time))])
+            elif depth > 0 and not stu_blockers and len(fac_blockers) <= 1:
+                # Eject one interview of the faculty (the blocking one, if any) and reinsert its student
+                ejected = fac_blockers or ([] if has_capacity else list(state[fac]))
+                for slot in ejected:
+                    plan = [("remove", slot), ("add", (fac, stu, time))]
+                    _apply(state, plan)
+                    followers = _insertion_plans(state, slot[1], depth - 1, times_all, faculty_all, students_all,
+                                                 coefficient, exclude | {fac})
+                    _apply(state, plan, undo=True)
+                    if followers:
+                        plans.append(plan + min(followers, key=lambda p: _plan_key(p, coefficient)))
+    return plans
+
+
+def repair(times_all, faculty_all, students_all, matrix, max_depth=2):
+    """
+    Repairs a published matrix after withdrawals or availability changes, touching as
+    few existing interviews as possible: broken interviews are dropped (see
+    clean_previous_matrix), then each student left short gets interviews back by
+    direct insertion, moving one blocking interview, or ejection chains up to max_depth.
+    Returns: (list of (fac, stu, time), list of ("add" | "remove", (fac, stu, time)) changes)
+    """
+    kept = aws.clean_previous_matrix(matrix, times_all, faculty_all, students_all)
+    state = defaultdict(set)
+    _apply(state, [("add", slot) for slot in kept])
+
+    cache = {}
+
+    def coefficient(slot):
+        if slot not in cache:
+            cache[slot] = aws.interview_coefficients([slot], faculty_all, students_all)[slot]
+        return cache[slot]
+
+    changes = [("remove", slot) for slot in matrix if slot not in kept]
+    for stu in students_all:
+        while len(state[stu]) < aws.interview_number:
+            plans = []
+            for depth in range(max_depth + 1):
+                plans = _insertion_plans(state, stu, depth, times_all, faculty_all, students_all, coefficient, set())
+                if plans:
+                    break
+            if not plans:
+                print(f"Repair: could not find another interview for student {stu}")
+                break
+            plan = min(plans, key=lambda p: _plan_key(p, coefficient))
+            _apply(state, plan)
+            changes.extend(plan)
+
+    repaired = set(slot for stu in students_all for slot in state[stu])
+    touched = len([slot for slot in kept if slot not in repaired])
+    print(f"Repair: {len(changes)} changes, {touched} existing interviews moved or replaced")
+    return ([slot for slot in kept if slot in repaired] + [slot for slot in repaired if slot not in kept], changes)
+
+
+def _person_value(times_all, slots, is_faculty):
+    """
+    Consecutive and block terms of one person's interviews
+    """
+    person_times = [time for _, _, time in slots]
+    value = aws.weights["consecutive"] * aws.consecutives(times_all, person_times)
+    if is_faculty:
+        value += aws.weights["block"] * len(set(times_all[time]["time block"] for time in person_times))
+    return value
+
+
+def anneal(times_all, faculty_all, students_all, budget, matrix=(), seed=None, report_every=10):
+    """
+    Anytime simulated annealing on the objective of the model, within a wall-clock budget.
+    Starts from a complete schedule (quick_draft, repaired) and only makes moves that keep
+    every hard constraint, so the best schedule so far is always valid:
+    move an interview to another time, give it to another faculty, or swap the
+    faculty of two interviews keeping their times.
+    Temperature decreases geometrically with the elapsed time.
+    Input: times, faculty and student dictionnaries, budget in seconds, optional start schedule
+    Returns: (best list of (fac, stu, time), list of (elapsed seconds, best objective))
+    """
+    rng = random.Random(seed)
+    start_time = time_module.time()
+
+    draft = quick_draft(times_all, faculty_all, students_all, matrix)
+    current, _ = repair(times_all, faculty_all, students_all, draft)
+    state = defaultdict(set)
+    _apply(state, [("add", slot) for slot in current])
+    slots = list(current)
+    position = {slot: i for i, slot in enumerate(slots)}
+
+    coefficients = {}
+    pair_times = {}
+
+    def coefficient(slot):
+        if slot not in coefficients:
+            coefficients[slot] = aws.interview_coefficients([slot], faculty_all, students_all)[slot]
+        return coefficients[slot]
+
+    def feasible_times(fac, stu):
+        if (fac, stu) not in pair_times:
+            pair_times[fac, stu] = [] if aws.hard_excluded(students_all, stu, fac) \
+                else _pair_times(times_all, faculty_all, students_all, fac, stu)
+        return pair_times[fac, stu]
+
+    def is_free(person, time, ignore):
+        return not any(slot not in ignore and aws.times_overlap(times_all, time, slot[2]) for slot in state[person])
+
+    def random_move():
+        fac, stu, time = rng.choice(slots)
+        kind = rng.random()
+        if kind < 0.4:
+            others = feasible_times(fac, stu)
+            new = rng.choice(others) if others else time
+            if new != time and is_free(fac, new, [(fac, stu, time)]) and is_free(stu, new, [(fac, stu, time)]):
+                return [("remove", (fac, stu, time)), ("add", (fac, stu, new))]
+        elif kind < 0.7:
+            fac2 = rng.choice(faculty_list)
+            met = set(f for f, _, _ in state[stu])
+            others = feasible_times(fac2, stu)
+            if fac2 not in met and others and len(state[fac2]) < aws.max_faculty_interview:
+                new = rng.choice(others)
+                if is_free(fac2, new, []) and is_free(stu, new, [(fac, stu, time)]):
+                    return [("remove", (fac, stu, time)), ("add", (fac2, stu, new))]
+        else:
+            fac2, stu2, time2 = rng.choice(slots)
+            if fac2 != fac and stu2 != stu and time in feasible_times(fac2, stu) \
+                    and time2 in feasible_times(fac, stu2) \
+                    and fac2 not in set(f for f, _, _ in state[stu]) \
+                    and fac not in set(f for f, _, _ in state[stu2]) \
+                    and is_free(fac2, time, [(fac2, stu2, time2)]) and is_free(fac, time2, [(fac, stu, time)]):
+                return [("remove", (fac, stu, time)), ("remove", (fac2, stu2, time2)),
+                        ("add", (fac2, stu, time)), ("add", (fac, stu2, time2))]
+        return None
+
+    def delta(plan):
+        persons = set(person for _, (fac, stu, _) in plan for person in [fac, stu])
+        before = sum(_person_value(times_all, state[p], p in faculty_all) for p in persons)
+        _apply(state, plan)
+        after = sum(_person_value(times_all, state[p], p in faculty_all) for p in persons)
+        return after - before + sum(coefficient(slot) * (1 if change == "add" else -1) for change, slot in plan)
+
+    faculty_list = list(faculty_all)
+    value = aws.objective_parts(slots, times_all, faculty_all, students_all)["total"]
+    best, best_value = list(slots), value
+    history = [(time_module.time() - start_time, best_value)]
+    scale = max([abs(coefficient(slot)) for slot in slots] + [1])
+    temperature, final_temperature = scale, 0.01
+    last_report = 0
+    while slots:
+        elapsed = time_module.time() - start_time
+        if elapsed >= budget:
+            break
+        temperature = scale * (final_temperature / scale) ** (elapsed / budget)
+
+        plan = random_move()
+        if plan is None:
+            continue
+        change = delta(plan)
+        if change >= 0 or rng.random() < math.exp(change / temperature):
+            value += change
+            for kind, slot in plan:
+                if kind == "remove":
+                    i = position.pop(slot)
+                    last = slots.pop()
+                    if last != slot:
+                        slots[i] = last
+                        position[last] = i
+                else:
+                    position[slot] = len(slots)
+                    slots.append(slot)
+            if value > best_value + 1e-9:
+                best, best_value = list(slots), value
+                history.append((elapsed, best_value))
+        else:
+            _apply(state, plan, undo=True)
+
+        if elapsed - last_report >= report_every:
+            last_report = elapsed
+            print(f"Anneal {elapsed:.0f}s: best {best_value:.1f}, current {value:.1f}, temperature {temperature:.2f}")
+
+    print(f"Anneal: best objective {best_value:.1f} after {len(history) - 1} improvements")
+    return (best, history)
@@ -1,16 +1,30 @@
 import screening as m
+import solvers
+import argparse
+import os
 import random
 import pymysql
 import csv
 import toml
 from collections import Counter, defaultdict
 from pyomo.environ import *
-from pyomo.opt import SolverFactory
 
 year = 2020
 
 interview_number = 4
 max_faculty_interview = 7
+top_k = None # Faculty kept per student before solving (None: all faculty)
+backend = "cbc" # "cbc", "glpk" or "highs" (scipy, nothing to install), also --backend on the command line
+backend_options = { "cbc": {"threads": os.cpu_count(), "ratioGap": None, "sec": None}
+                  , "glpk": {"tmlim": None, "mipgap": None}
+                  , "highs": {"time_limit": None, "mip_rel_gap": None}
+                  } # None: solver default
+checkpoint = None # File keeping the best schedule during the solve, and its start on the next run
+                  # (None: no checkpoints), also --checkpoint on the command line
+checkpoint_interval = 60 # Seconds between two checkpoints
+time_limit = None # Wall-clock seconds of the solve with checkpoints (None: no limit), also --time-limit
+telemetry_log = "telemetry.jsonl" # Model sizes, solver progress and results, appended as JSON lines (None: console only)
+progress_interval = 5 # Seconds between two progress reports of the solver
 
 interview_low_score = 10 # Prints interviews with scores that low
 
@@ -205,11 +219,70 @@ def rejected_students(db, faculty, students):
                 if fac_id in matches:
                     matches[fac_id] += weights["rejected"]
 
-def make_matrix(faculty_all, students_all):
+def candidate_pairs(faculty_all, students_all, k):
+    """
+    Keeps each student's top K faculty by matching score, plus the pairs scoring at
+    least the invite weight (faculty of interest, requested and forced interviews)
+    Returns: list of (fac, stu)
+    """
+    pairs = []
+    for stu in students_all:
+        match = students_all[stu]["match"]
+        ranked = sorted(faculty_all, key=lambda fac: match[fac], reverse=True)
+        pairs.extend((fac, stu) for i, fac in enumerate(ranked)
+                     if i < k or match[fac] >= weights["invite"])
+    return pairs
+
+def make_matrix(faculty_all, students_all, top_k=top_k):
+    """
+    Builds and solves the interview model.
+    With top_k, only each student's top K faculty get variables (see candidate_pairs),
+    and K doubles until the pruned model is feasible.
+    With a checkpoint file, the solve stops after time_limit seconds and keeps its best
+    schedule in the file, and starts from the schedule already in the file.
+    The size of each model and the progress of the solver are printed and logged to telemetry_log.
+    Returns: list of (fac, stu, time)
+    """
+    report = solvers.progress_logger(telemetry_log, str(year), progress_interval)
+    k = top_k or len(faculty_all)
+    saved = solvers.load_checkpoint(checkpoint)
+    if saved:
+        print(f"Resuming from the checkpoint of {saved['saved']}: objective {saved['objective']}, "
+              f"bound {saved['bound']}")
+    while True:
+        model = build_model(faculty_all, students_all, candidate_pairs(faculty_all, students_all, k))
+        solvers.show_model_size(model, report)
+
+        if checkpoint:
+            started = [row for row in saved["rows"] if row in model.grid] if saved else []
+            for row in started:
+                model.grid[row].set_value(1)
+            results = solvers.solve_checkpointed(model, backend, backend_options.get(backend), checkpoint,
+                                                 time_limit, checkpoint_interval, warmstart=bool(started),
+                                                 progress=report)
+        else:
+            results = solvers.solve(model, backend, backend_options.get(backend), progress=report)
+        infeasible = solvers.is_infeasible(results)
+        if not infeasible or k >= len(faculty_all):
+            break
+        k *= 2
+        print(f"Pruned model infeasible, trying again with the top {k} faculty per student")
+
+    print(solvers.summary(results))
+    report({"event": "result", **results})
+    if results["objective"] is None:
+        return []
+
+    matrix = []
+    for fac, stu, time in model.grid:
+        if (model.grid[fac, stu, time].value or 0) > 0.5:
+            matrix.append((fac, stu, time))
+
+    return matrix
+
+def build_model(faculty_all, students_all, pairs):
     # Define parameters
     times = sorted_timeslots
-    faculty = faculty_all.keys()
-    students = students_all.keys()
 
     time_pref = { time: weights["timeslot"]*i/(len(sorted_timeslots)-1) \
                         for i, time in enumerate(reversed(sorted_timeslots))}
@@ -218,9 +291,20 @@ def make_matrix(faculty_all, students_all):
     model = ConcreteModel()
 
     # binary variables representing the time and session of each fac
-    model.grid = Var(((fac, stu, time) for fac in faculty for stu in students for time in times) ,
+    model.grid = Var(((fac, stu, time) for fac, stu in pairs for time in times) ,
                            within=Binary, initialize=0)
 
+    # Group variables by person, pair and time
+    by_stu, by_fac, by_pair = defaultdict(list), defaultdict(list), defaultdict(list)
+    by_fac_time, by_stu_time = defaultdict(list), defaultdict(list)
+    for fac, stu, time in model.grid:
+        var = model.grid[fac, stu, time]
+        by_stu[stu].append(var)
+        by_fac[fac].append(var)
+        by_pair[fac, stu].append(var)
+        by_fac_time[fac, time].append(var)
+        by_stu_time[stu, time].append(var)
+
     # Define an objective function with model as input, to pass later
     def obj_rule(m):
         timing = sum(m.grid[fac, stu, time] * time_pref[time] for fac, stu, time in m.grid)
@@ -228,8 +312,8 @@ def make_matrix(faculty_all, students_all):
         matching = sum(m.grid[fac, stu, time] * students_all[stu]["match"][fac] \
                                                    for fac, stu, time in m.grid)
 
-        unavailable = sum(m.grid[fac, stu, time] * (time not in faculty_all[fac]["avail"] ) \
-                                                   for fac, stu, time in m.grid)
+        unavailable = sum(m.grid[fac, stu, time] for fac, stu, time in m.grid \
+                                                   if time not in faculty_all[fac]["avail"])
 
         return timing + matching + weights["unavailable"]*unavailable
 
@@ -239,57 +323,36 @@ def make_matrix(faculty_all, students_all):
     model.constraints = ConstraintList()  # Create a set of constraints
 
     # Constraint: N interviews per student
-    for stu in students:
+    for stu in students_all:
         model.constraints.add(
-            sum(model.grid[fac, stu, time] for fac in faculty for time in times) \
-             == interview_number
+            sum(by_stu[stu]) == interview_number
         )
 
     # Constraint: Maximum interviews per faculty
-    for fac in faculty:
+    for fac in by_fac:
         model.constraints.add(
-            sum(model.grid[fac, stu, time] for stu in students for time in times) \
-             <=  max_faculty_interview
+            sum(by_fac[fac]) <=  max_faculty_interview
         )
 
     # Constraint: Max one interview per time per faculty
-    for fac in faculty:
-        for time in times:
-            model.constraints.add(
-                sum( model.grid[fac, stu, time] for stu in students) <= 1
-            )
+    for fac, time in by_fac_time:
+        model.constraints.add(
+            sum(by_fac_time[fac, time]) <= 1
+        )
 
     # Constraint: Max one interview per time per student
-    for stu in students:
-        for time in times:
-            model.constraints.add(
-                sum( model.grid[fac, stu, time] for fac in faculty) <= 1
-            )
+    for stu, time in by_stu_time:
+        model.constraints.add(
+            sum(by_stu_time[stu, time]) <= 1
+        )
 
     # Constraint: each student/faculty pair interviews maximum once
-    for stu in students:
-        for fac in faculty:
-            model.constraints.add(
-                sum( model.grid[fac, stu, time] for time in times ) <= 1
-            )
-
-
-    model.preprocess()
-    # opt = SolverFactory('cbc', validate = False)  # Select solver
-    # solver_manager = SolverManagerFactory('neos')  # Solve in neos server
-    # results = solver_manager.solve(model, opt=opt)
-
-    opt = SolverFactory('cbc')
-    results = opt.solve(model) # Solve locally
-
-    print(results)
-
-    matrix = []
-    for fac, stu, time in model.grid:
-        if model.grid[fac, stu, time].value:
-            matrix.append((fac, stu, time))
+    for fac, stu in by_pair:
+        model.constraints.add(
+            sum(by_pair[fac, stu]) <= 1
+        )
 
-    return matrix
+    return model
 
 def matrix_analysis(matrix_original, faculty, students):
     matrix = defaultdict(list)
@@ -358,6 +421,13 @@ def export_matrix(db, matrix):
     pass
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=solvers.backends, default=backend, help="Solver backend")
+    parser.add_argument("--checkpoint", default=checkpoint, help="File keeping the best schedule during the solve")
+    parser.add_argument("--time-limit", type=float, default=time_limit, help="Seconds of solve with checkpoints")
+    args = parser.parse_args()
+    backend, checkpoint, time_limit = args.backend, args.checkpoint, args.time_limit
+
     login = toml.load("login.toml")
     selection_db = m.connect(login, f"selection_{year}")
     matrix_db = m.connect(login, "matrix")
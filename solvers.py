@@ -0,0 +1,607 @@
+import io
+import json
+import os
+import re
+import sys
+import time as time_module
+from contextlib import redirect_stdout
+from pyomo.core.expr.visitor import identify_variables
+from pyomo.environ import *
+from pyomo.opt import SolverFactory
+from pyomo.repn import generate_standard_repn
+from scipy.optimize import milp, linprog, Bounds, LinearConstraint
+from scipy.sparse import coo_matrix, vstack
+
+# Backends: "cbc" and "glpk" through Pyomo, "highs" through scipy.optimize.milp (nothing to install)
+backends = ["cbc", "glpk", "highs"]
+
+# Option setting the time limit in seconds for each backend
+time_limit_options = {"cbc": "sec", "glpk": "tmlim", "highs": "time_limit",
+                      "gurobi": "TimeLimit", "cplex": "timelimit"}
+
+
+def available(backend):
+    """
+    Whether the backend can be used here
+    """
+    if backend == "highs":
+        return True
+    return SolverFactory(backend).available(exception_flag=False)
+
+
+def is_infeasible(result):
+    return result["status"] == "infeasible"
+
+
+def summary(result):
+    """
+    One line description of a result
+    """
+    def number(x):
+        return "-" if x is None else f"{x:.6g}"
+    gap = "-" if result["gap"] is None else f"{100 * result['gap']:.2f}%"
+    return f"Solver {result['backend']}: {result['status']}, objective {number(result['objective'])}, " \
+           f"bound {number(result['bound'])}, gap {gap}, {result['runtime']:.1f}s"
+
+
+def active_objective(model):
+    return next(model.component_data_objects(Objective, active=True))
+
+
+def make_result(backend, status, objective, bound, runtime):
+    """
+    Result of a solve, the same for every backend
+    Returns: dictionary with status ("optimal", "feasible": stopped with a solution,
+             "infeasible", "no solution": stopped without one, "error"),
+             objective, bound, relative gap and runtime in seconds
+    """
+    gap = None
+    if objective is not None and bound is not None and abs(bound) != float("inf"):
+        gap = abs(bound - objective) / max(abs(objective), 1e-9)
+    return {"backend": backend, "status": status, "objective": objective, "bound": bound,
+            "gap": gap, "runtime": runtime}
+
+
+def solve(model, backend="cbc", options=None, duals=False, warmstart=False, progress=None):
+    """
+    Solves the model with the backend, loading the solution only if one was found.
+    Options are passed to the backend as they are, options set to None are skipped,
+    e.g. {"threads": 8, "ratioGap": 0.01, "sec": 600} for CBC.
+    With duals, the duals of an LP are imported in model.dual.
+    With warmstart, the current variable values are a MIP start (CBC and HiGHS).
+    With progress (see progress_logger), the incumbent, bound, gap and nodes are reported
+    during the search: HiGHS then runs through highspy callbacks, CBC and GLPK logs are parsed.
+    HiGHS also runs through highspy for a MIP start, scipy milp takes none.
+    Returns: result dictionary (see make_result)
+    """
+    options = {key: option for key, option in (options or {}).items() if option is not None}
+    if duals and not hasattr(model, "dual"):
+        model.dual = Suffix(direction=Suffix.IMPORT)
+
+    if backend == "highs" and (progress or warmstart) and not duals:
+        return solve_highspy(model, options, warmstart=warmstart, progress=progress)
+    if backend == "highs":
+        return solve_highs(model, options, duals)
+
+    # opt = SolverFactory('cbc', validate = False)  # Select solver
+    # solver_manager = SolverManagerFactory('neos')  # Solve in neos server
+    # results = solver_manager.solve(model, opt=opt)
+
+    start_time = time_module.time()
+    opt = SolverFactory(backend)
+    opt.options.update(options)
+    warmstart = warmstart and opt.warm_start_capable()
+    try:
+        if progress:
+            sign = -1 if backend == "cbc" and active_objective(model).sense == maximize else 1
+            with redirect_stdout(_SolverLog(backend, sign, progress)):
+                results = opt.solve(model, load_solutions=False, warmstart=warmstart, tee=True)
+        else:
+            results = opt.solve(model, load_solutions=False, warmstart=warmstart)
+    except Exception as error:
+        print(f"Solver {backend} failed: {error}")
+        return make_result(backend, "error", None, None, time_module.time() - start_time)
+    runtime = time_module.time() - start_time
+
+    condition = results.solver.termination_condition
+    if condition in [TerminationCondition.infeasible, TerminationCondition.infeasibleOrUnbounded]:
+        return make_result(backend, "infeasible", None, None, runtime)
+    if not len(results.solution):
+        return make_result(backend, "no solution", None, None, runtime)
+
+    model.solutions.load_from(results)
+    objective = active_objective(model)
+    bound = results.problem.upper_bound if objective.sense == maximize else results.problem.lower_bound
+    status = "optimal" if condition == TerminationCondition.optimal else "feasible"
+    if status == "optimal" and (bound is None or abs(bound) == float("inf")):
+        bound = value(objective)
+    return make_result(backend, status, value(objective), bound, runtime)
+
+
+def linear_form(model):
+    """
+    Reads a linear model into arrays: objective, constraint matrix and bounds
+    Returns: (variables, constraints, costs, objective constant, sparse matrix,
+              row lower bounds, row upper bounds, integrality)
+    """
+    variables = list(model.component_data_objects(Var))
+    index = {id(var): i for i, var in enumerate(variables)}
+
+    objective = generate_standard_repn(active_objective(model).expr)
+    costs = [0.0] * len(variables)
+    for var, coef in zip(objective.linear_vars, objective.linear_coefs):
+        costs[index[id(var)]] += coef
+
+    constraints = list(model.component_data_objects(Constraint, active=True))
+    rows, cols, coefs, lower, upper = [], [], [], [], []
+    for i, constraint in enumerate(constraints):
+        repn = generate_standard_repn(constraint.body)
+        for var, coef in zip(repn.linear_vars, repn.linear_coefs):
+            rows.append(i)
+            cols.append(index[id(var)])
+            coefs.append(coef)
+        lb, ub = constraint.lb, constraint.ub
+        lower.append(-float("inf") if lb is None else lb - repn.constant)
+        upper.append(float("inf") if ub is None else ub - repn.constant)
+    a = coo_matrix((coefs, (rows, cols)), shape=(len(constraints), len(variables))).tocsr()
+    integrality = [1 if var.is_integer() else 0 for var in variables]
+
+    return (variables, constraints, costs, objective.constant, a, lower, upper, integrality)
+
+
+def solve_highs(model, options, duals=False):
+    """
+    Solves the model with HiGHS through scipy: milp, or linprog for the duals of an LP.
+    Options are scipy milp options (time_limit, mip_rel_gap, presolve, node_limit).
+    Returns: result dictionary (see make_result)
+    """
+    start_time = time_module.time()
+    variables, constraints, costs, constant, a, lower, upper, integrality = linear_form(model)
+    sign = -1 if active_objective(model).sense == maximize else 1  # scipy minimizes
+    costs = [sign * c for c in costs]
+    bounds = [(-float("inf") if var.lb is None else var.lb, float("inf") if var.ub is None else var.ub)
+              for var in variables]
+
+    if duals and not any(integrality):
+        return solve_highs_lp(model, variables, constraints, costs, constant, a, lower, upper, bounds,
+                              sign, start_time)
+
+    rows = [LinearConstraint(a, lower, upper)] if constraints else []
+    result = milp(costs, constraints=rows, integrality=integrality,
+                  bounds=Bounds([lb for lb, ub in bounds], [ub for lb, ub in bounds]), options=options)
+    runtime = time_module.time() - start_time
+
+    if result.status == 2:
+        return make_result("highs", "infeasible", None, None, runtime)
+    if result.x is None:
+        return make_result("highs", "no solution" if result.status == 1 else "error", None, None, runtime)
+
+    for var, x, integer in zip(variables, result.x, integrality):
+        var.set_value(round(x) if integer else x, skip_validation=True)
+    objective = sign * result.fun + constant
+    bound = getattr(result, "mip_dual_bound", None)
+    if bound is not None and any(integrality):
+        bound = sign * bound + constant
+    elif result.status == 0:
+        bound = objective
+    return make_result("highs", "optimal" if result.status == 0 else "feasible", objective, bound, runtime)
+
+
+def solve_highs_lp(model, variables, constraints, costs, constant, a, lower, upper, bounds, sign, start_time):
+    """
+    Solves an LP with linprog to get the duals, in the sign convention of Pyomo
+    (change of the objective per unit increase of the right-hand side)
+    Returns: result dictionary (see make_result)
+    """
+    eq = [i for i in range(len(constraints)) if lower[i] == upper[i]]
+    ub = [i for i in range(len(constraints)) if lower[i] != upper[i] and upper[i] != float("inf")]
+    lb = [i for i in range(len(constraints)) if lower[i] != upper[i] and lower[i] != -float("inf")]
+    # Rows with a lower bound are negated into <= rows
+    a_ub = vstack([a[ub], -a[lb]]).tocsr() if ub or lb else None
+    b_ub = [upper[i] for i in ub] + [-lower[i] for i in lb] if ub or lb else None
+
+    result = linprog(costs, A_ub=a_ub, b_ub=b_ub, A_eq=a[eq] if eq else None,
+                     b_eq=[lower[i] for i in eq] if eq else None, bounds=bounds, method="highs")
+    runtime = time_module.time() - start_time
+    if result.status == 2:
+        return make_result("highs", "infeasible", None, None, runtime)
+    if result.status != 0:
+        return make_result("highs", "error", None, None, runtime)
+
+    for var, x in zip(variables, result.x):
+        var.set_value(x, skip_validation=True)
+    model.dual.clear()
+    for i, m in zip(eq, result.eqlin.marginals if eq else []):
+        model.dual[constraints[i]] = sign * m
+    marginals = list(result.ineqlin.marginals) if ub or lb else []
+    for i, m in zip(ub, marginals[:len(ub)]):
+        model.dual[constraints[i]] = sign * m
+    for i, m in zip(lb, marginals[len(ub):]):
+        model.dual[constraints[i]] = model.dual.get(constraints[i], 0) - sign * m
+    objective = sign * result.fun + constant
+    return make_result("highs", "optimal", objective, objective, runtime)
+
+
+def persistent(backend="highs", options=None):
+    """
+    Persistent solver interface (Pyomo APPSI) for models solved many times: the model is
+    sent to the solver once and later solves only pass the changed parameters.
+    Options time_limit and mip_gap are common, the others go to the solver itself.
+    Returns: solver object for solve_persistent
+    """
+    from pyomo.contrib.appsi import solvers as appsi
+    opt = {"highs": appsi.Highs, "cbc": appsi.Cbc, "gurobi": appsi.Gurobi}[backend]()
+    for key, option in (options or {}).items():
+        if option is None:
+            continue
+        if key in opt.config:
+            opt.config[key] = option
+        else:
+            getattr(opt, f"{backend}_options")[key] = option
+    return opt
+
+
+def keep_structure(opt):
+    """
+    Tells a persistent solver that only parameter values change from now on,
+    so it does not look for new variables, constraints or objectives
+    """
+    for update in ["check_for_new_or_removed_constraints", "check_for_new_or_removed_vars",
+                   "check_for_new_or_removed_params", "check_for_new_objective",
+                   "update_constraints", "update_vars", "update_named_expressions"]:
+        opt.update_config[update] = False
+
+
+def solve_persistent(opt, model, warmstart=False):
+    """
+    Solves the model with a persistent solver (see persistent), from the current
+    variable values with warmstart, loading the solution only if one was found.
+    Returns: result dictionary (see make_result)
+    """
+    from pyomo.contrib.appsi.base import TerminationCondition as Condition
+    name = f"persistent {type(opt).__name__.lower()}"
+    if "warmstart" in opt.config:
+        opt.config.warmstart = warmstart
+    opt.config.load_solution = False
+
+    start_time = time_module.time()
+    results = opt.solve(model)
+    runtime = time_module.time() - start_time
+
+    if results.termination_condition in [Condition.infeasible, Condition.infeasibleOrUnbounded]:
+        return make_result(name, "infeasible", None, None, runtime)
+    if results.best_feasible_objective is None:
+        return make_result(name, "no solution", None, None, runtime)
+    results.solution_loader.load_vars()
+    status = "optimal" if results.termination_condition == Condition.optimal else "feasible"
+    return make_result(name, status, results.best_feasible_objective, results.best_objective_bound, runtime)
+
+
+def grid_rows(model):
+    """
+    Selected interviews of a model with a grid variable indexed by (fac, stu, time)
+    Returns: list of (fac, stu, time)
+    """
+    return [index for index in model.grid if (model.grid[index].value or 0) > 0.5]
+
+
+def save_checkpoint(filename, rows, objective, bound):
+    """
+    Writes the best schedule found so far, with its objective and the solver bound.
+    The file is replaced in one step, so an interrupted write keeps the previous checkpoint.
+    """
+    if bound is not None and abs(bound) == float("inf"):
+        bound = None
+    with open(filename + ".tmp", "w") as f:
+        json.dump({"rows": [list(row) for row in rows], "objective": objective, "bound": bound,
+                   "saved": time_module.strftime("%Y-%m-%d %H:%M:%S")}, f)
+    os.replace(filename + ".tmp", filename)
+
+
+def load_checkpoint(filename):
+    """
+    Reads a checkpoint written by save_checkpoint
+    Returns: dictionary with rows as (fac, stu, time), objective, bound and saved, or None if there is none
+    """
+    if not filename or not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        saved = json.load(f)
+    saved["rows"] = [tuple(row) for row in saved["rows"]]
+    return saved
+
+
+def solve_checkpointed(model, backend, options, checkpoint, time_limit=None, interval=60, warmstart=False,
+                       rows=grid_rows, progress=None):
+    """
+    Solves the model within time_limit seconds of wall clock (None: no limit), writing the
+    best schedule found so far to the checkpoint file (see save_checkpoint) at most every
+    interval seconds and at the end. rows(model) gives the schedule of the current values.
+    HiGHS (highspy) reports each improving solution through a callback, and the last one
+    is written when the solve ends even if it came less than interval seconds after a
+    checkpoint. The Pyomo backends cannot, so they are solved in rounds of interval
+    seconds (or the time limit in options if shorter), each one starting from the
+    incumbent of the previous round, until a round improves neither the objective nor
+    the bound (a single round if the backend takes no MIP start).
+    With warmstart, the current variable values are a MIP start.
+    Progress is reported as in solve.
+    Returns: result dictionary (see make_result)
+    """
+    options = {key: option for key, option in (options or {}).items() if option is not None}
+    if backend == "highs":
+        start_time = time_module.time()
+        last = {"saved": None}
+        pending = {}
+
+        def write():
+            save_checkpoint(checkpoint, pending["rows"], pending["objective"], pending["bound"])
+            last["saved"] = time_module.time()
+            bound = pending["bound"]
+            bound = "-" if bound is None or abs(bound) == float("inf") else f"{bound:.6g}"
+            print(f"Checkpoint: objective {pending['objective']:.6g}, bound {bound}, "
+                  f"{time_module.time() - start_time:.0f}s")
+            pending.clear()
+
+        def keep(objective, bound):
+            # Solutions found within interval seconds of the last checkpoint wait for the next one
+            pending.update(rows=rows(model), objective=objective, bound=bound)
+            if last["saved"] is None or time_module.time() - last["saved"] >= interval:
+                write()
+
+        try:
+            result = solve_highspy(model, options, time_limit, warmstart, keep, progress)
+        finally:
+            # Also when the solve is interrupted
+            if pending:
+                write()
+        if result["objective"] is not None:
+            pending.update(rows=rows(model), objective=result["objective"], bound=result["bound"])
+            write()
+        return result
+
+    start_time = time_module.time()
+    rounds = available(backend) and SolverFactory(backend).warm_start_capable()
+    option = time_limit_options[backend]
+    best = None
+    while True:
+        left = None if time_limit is None else time_limit - (time_module.time() - start_time)
+        limit = [t for t in [left, interval if rounds else None, options.get(option)] if t is not None]
+        round_options = dict(options)
+        if limit:
+            round_options[option] = max(min(limit), 1)
+        result = solve(model, backend, round_options, warmstart=warmstart, progress=progress)
+        if result["objective"] is None:
+            # A later round without a solution leaves the model at the previous incumbent
+            best = best or result
+            break
+        save_checkpoint(checkpoint, rows(model), result["objective"], result["bound"])
+        print(f"Checkpoint: {summary(result)}")
+        warmstart = True
+        improved = best is None or result["objective"] != best["objective"] or result["bound"] != best["bound"]
+        best = result
+        out_of_time = left is not None and time_module.time() - start_time >= time_limit - 1
+        if result["status"] == "optimal" or not rounds or out_of_time or not improved:
+            break
+    return make_result(backend, best["status"], best["objective"], best["bound"],
+                       time_module.time() - start_time)
+
+
+def solve_highspy(model, options, time_limit=None, warmstart=False, solution=None, progress=None):
+    """
+    Solves the model with highspy, which reports to callbacks during the search:
+    solution(objective, bound) after each improving solution has been loaded in the model,
+    progress(record) as in solve.
+    Returns: result dictionary (see make_result)
+    """
+    import highspy
+    start_time = time_module.time()
+    variables, constraints, costs, constant, a, lower, upper, integrality = linear_form(model)
+    lp = highspy.HighsLp()
+    lp.num_col_, lp.num_row_ = len(variables), len(constraints)
+    lp.col_cost_ = costs
+    lp.offset_ = constant
+    lp.sense_ = highspy.ObjSense.kMaximize if active_objective(model).sense == maximize else highspy.ObjSense.kMinimize
+    lp.col_lower_ = [-highspy.kHighsInf if var.lb is None else var.lb for var in variables]
+    lp.col_upper_ = [highspy.kHighsInf if var.ub is None else var.ub for var in variables]
+    lp.row_lower_ = [-highspy.kHighsInf if lb == -float("inf") else lb for lb in lower]
+    lp.row_upper_ = [highspy.kHighsInf if ub == float("inf") else ub for ub in upper]
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    lp.a_matrix_.num_col_, lp.a_matrix_.num_row_ = len(variables), len(constraints)
+    lp.a_matrix_.start_, lp.a_matrix_.index_, lp.a_matrix_.value_ = a.indptr, a.indices, a.data
+    lp.integrality_ = [highspy.HighsVarType.kInteger if i else highspy.HighsVarType.kContinuous
+                       for i in integrality]
+
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", False)
+    for key, option in options.items():
+        h.setOptionValue(key, option)
+    if time_limit is not None:
+        h.setOptionValue("time_limit", float(min(time_limit, options.get("time_limit", time_limit))))
+    h.passModel(lp)
+    if warmstart:
+        start = highspy.HighsSolution()
+        start.col_value = [var.value or 0 for var in variables]
+        start.value_valid = True
+        h.setSolution(start)
+
+    def load(values):
+        for var, x, integer in zip(variables, values, integrality):
+            var.set_value(round(x) if integer else x, skip_validation=True)
+
+    def record(event, data):
+        incumbent = data.mip_primal_bound if abs(data.mip_primal_bound) != highspy.kHighsInf else None
+        bound = data.mip_dual_bound if abs(data.mip_dual_bound) != highspy.kHighsInf else None
+        progress(progress_record(event, "highs", data.running_time, incumbent, bound, data.mip_node_count))
+
+    def improving(event):
+        if solution:
+            load(event.data_out.mip_solution)
+            solution(event.data_out.objective_function_value, event.data_out.mip_dual_bound)
+        if progress:
+            record("solution", event.data_out)
+
+    h.cbMipImprovingSolution.subscribe(improving)
+    if progress:
+        h.cbMipInterrupt.subscribe(lambda event: record("progress", event.data_out))
+    h.run()
+    runtime = time_module.time() - start_time
+
+    status = h.getModelStatus()
+    if status == highspy.HighsModelStatus.kInfeasible:
+        return make_result("highs", "infeasible", None, None, runtime)
+    info = h.getInfo()
+    if info.primal_solution_status != 2:  # kSolutionStatusFeasible
+        return make_result("highs", "no solution", None, None, runtime)
+    load(h.getSolution().col_value)
+    objective = info.objective_function_value
+    bound = info.mip_dual_bound if any(integrality) else objective
+    return make_result("highs", "optimal" if status == highspy.HighsModelStatus.kOptimal else "feasible",
+                       objective, bound, runtime)
+
+
+def model_size(model):
+    """
+    Variables, rows and nonzeros of each family (Pyomo component) of a model, empty families left out
+    Returns: list of dictionaries with family, variables, rows and nonzeros
+    """
+    families = []
+    for var in model.component_objects(Var, active=True):
+        if len(var):
+            families.append({"family": var.name, "variables": len(var), "rows": 0, "nonzeros": 0})
+    for constraint in model.component_objects(Constraint, active=True):
+        if not len(constraint):
+            continue
+        nonzeros = sum(len(list(identify_variables(data.body, include_fixed=False)))
+                       for data in constraint.values())
+        families.append({"family": constraint.name, "variables": 0, "rows": len(constraint),
+                         "nonzeros": nonzeros})
+    return families
+
+
+def show_model_size(model, progress=None):
+    """
+    Prints the size of each family of the model and an estimate of the memory the
+    solver needs for it: about 24 bytes per nonzero (row and column copies of the
+    matrix) and 100 bytes per row and column, plus the peak memory of this process.
+    The totals are also passed to progress (see progress_logger).
+    Returns: dictionary of totals
+    """
+    families = model_size(model)
+    print(f"\nModel size:\n{'family':<24}{'variables':>12}{'rows':>12}{'nonzeros':>12}")
+    for family in families:
+        print(f"{family['family']:<24}{family['variables']:>12}{family['rows']:>12}{family['nonzeros']:>12}")
+    totals = {key: sum(family[key] for family in families) for key in ["variables", "rows", "nonzeros"]}
+    print(f"{'total':<24}{totals['variables']:>12}{totals['rows']:>12}{totals['nonzeros']:>12}")
+
+    totals["solver MB"] = (24 * totals["nonzeros"] + 100 * (totals["variables"] + totals["rows"])) / 1e6
+    try:
+        import resource
+        # Kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        totals["process MB"] = peak / (1e6 if sys.platform == "darwin" else 1e3)
+    except ImportError:
+        totals["process MB"] = None
+    process = "-" if totals["process MB"] is None else f"{totals['process MB']:.0f} MB"
+    print(f"Estimated solver memory {totals['solver MB']:.1f} MB, Python process peak {process}")
+    if progress:
+        progress({"event": "size", "families": families, **totals})
+    return totals
+
+
+def progress_record(event, backend, elapsed, incumbent, bound, nodes):
+    """
+    Record of the solver progress, event is "progress" or "solution"
+    Returns: dictionary with event, backend, elapsed seconds, incumbent, bound, relative gap and nodes
+    """
+    gap = None
+    if incumbent is not None and bound is not None:
+        gap = abs(bound - incumbent) / max(abs(incumbent), 1e-9)
+    return {"event": event, "backend": backend, "elapsed": elapsed, "incumbent": incumbent, "bound": bound,
+            "gap": gap, "nodes": nodes}
+
+
+def progress_logger(filename=None, label=None, interval=5):
+    """
+    Reporter for model sizes and solver progress: appends each record to the JSON lines
+    file (None: no file) with the label and the time, and prints the progress.
+    Progress is kept at most every interval seconds, improving solutions always.
+    Returns: function taking a record (see progress_record and show_model_size),
+             other events (e.g. the result of the solve) are only logged
+    """
+    last = {"reported": None}
+    console = sys.stdout  # Pyomo solver logs are redirected during the solve (see _SolverLog)
+
+    def report(record):
+        if record["event"] == "progress":
+            if last["reported"] is not None and time_module.time() - last["reported"] < interval:
+                return
+            last["reported"] = time_module.time()
+        record = {"label": label, "time": time_module.strftime("%Y-%m-%d %H:%M:%S"), **record}
+        if filename:
+            with open(filename, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        if record["event"] not in ["progress", "solution"]:
+            return
+
+        def number(x):
+            return "-" if x is None else f"{x:.6g}"
+        gap = "-" if record["gap"] is None else f"{100 * record['gap']:.2f}%"
+        nodes = "-" if record["nodes"] is None else record["nodes"]
+        found = "New incumbent" if record["event"] == "solution" else "Progress"
+        print(f"{found} {record['backend']}: incumbent {number(record['incumbent'])}, "
+              f"bound {number(record['bound'])}, gap {gap}, {nodes} nodes, {record['elapsed']:.0f}s", file=console)
+    return report
+
+
+def parse_progress(backend, line, sign, elapsed):
+    """
+    Reads a line of the CBC or GLPK log. CBC minimizes, so its values of a maximized
+    objective are multiplied by sign (-1) to get back to the model objective.
+    Returns: progress record (see progress_record) or None for other lines
+    """
+    def number(text):
+        try:
+            x = float(text)
+        except ValueError:
+            return None
+        return None if abs(x) >= 1e50 else x
+
+    if backend == "cbc":
+        match = re.search(r"After (\d+) nodes, \d+ on tree, (\S+) best solution, best possible (\S+) "
+                          r"\(([\d.]+) seconds\)", line)
+        if match:
+            incumbent, bound = number(match.group(2)), number(match.group(3))
+            return progress_record("progress", backend, float(match.group(4)),
+                                   None if incumbent is None else sign * incumbent,
+                                   None if bound is None else sign * bound, int(match.group(1)))
+        match = re.search(r"Integer solution of (\S+) found .* (\d+) nodes \(([\d.]+) seconds\)", line)
+        if match:
+            return progress_record("solution", backend, float(match.group(3)), sign * float(match.group(1)),
+                                   None, int(match.group(2)))
+    elif backend == "glpk":
+        # "+  1234: mip =   8.755000000e+03 <=   1.028700000e+04  17.5% (12; 40)"
+        match = re.search(r"^[+*]\s*\d+: mip =\s+(.*?)\s+[<>]=\s+(.*?)\s+(?:[\d.]+%\s+)?\((\d+); (\d+)\)", line)
+        if match:
+            return progress_record("progress", backend, elapsed, number(match.group(1)), number(match.group(2)),
+                                   int(match.group(3)) + int(match.group(4)))
+    return None
+
+
+class _SolverLog(io.TextIOBase):
+    """
+    Stream given to Pyomo as stdout during a solve: the solver log is read line by
+    line and only the progress it contains is reported
+    """
+    def __init__(self, backend, sign, progress):
+        self.backend, self.sign, self.progress = backend, sign, progress
+        self.start_time = time_module.time()
+        self.buffer = ""
+
+    def write(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            record = parse_progress(self.backend, line, self.sign, time_module.time() - self.start_time)
+            if record:
+                self.progress(record)
+        return len(text)
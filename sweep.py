@@ -0,0 +1,155 @@
+import aws_online_matrix as aws
+import feasibility
+import csv
+import itertools
+import multiprocessing
+import os
+import time as time_module
+
+# Values tried for each parameter, every combination is solved
+# Parameters: weights of aws_online_matrix.mutable_weights, "interview_number", "max_faculty_interview"
+sweep_grid = {"invite": [50, 80],
+              "consecutive": [0, 10],
+              "max_faculty_interview": [8, 10]}
+sweep_workers = None  # Processes (None: one per core)
+sweep_output = "sweep.csv"  # Comparison table written here too (None: printed only)
+
+# "total" and its parts use the base weights, "variant total" the weights the variant was solved with
+columns = ["total", "variant total", "matching", "maybe", "consecutive", "block", "interviews",
+           "score per candidate", "score per faculty", "faculty without interviews", "students short", "seconds"]
+
+# Inputs shared with the workers, read only. Forked workers see them without a copy
+_inputs = {}
+
+
+def settings_grid(grid):
+    """
+    Every combination of the parameter values
+    Input: dictionary of lists of values, key=parameter
+    Returns: list of dictionaries of settings
+    """
+    for key in grid:
+        if key not in aws.mutable_weights + ["interview_number", "max_faculty_interview"]:
+            raise ValueError(f"Cannot sweep {key}: only {aws.mutable_weights}, interview_number "
+                             f"and max_faculty_interview")
+        for value in grid[key]:
+            aws.check_weights({key: value})
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def variant_students(students, settings):
+    """
+    Students with the invite and rejected weights of the settings in their matching
+    scores, which hold the weights of the configuration
+    Returns: dictionary of students (only the changed scores are copied)
+    """
+    changes = {key: settings[key] - aws.weights[key] for key in ["invite", "rejected"] if key in settings}
+    if not changes:
+        return students
+    variant = {}
+    for stu in students:
+        match = dict(students[stu]["match"])
+        for fac in students[stu]["invited"]:
+            match[fac] += changes.get("invite", 0)
+        for fac in students[stu]["rejected"]:
+            match[fac] += changes.get("rejected", 0)
+        variant[stu] = dict(students[stu], match=match)
+    return variant
+
+
+def _solve_variant(settings):
+    """
+    Worker: solves one variant with the shared inputs and the selected engine.
+    The engines read interview_number, max_faculty_interview and weights from the
+    aws_online_matrix module, so the settings are set there for the solve and put back
+    after it. Forked workers each have their own copy of the module, otherwise the
+    variants must be solved one at a time in this process (see sweep).
+    Pool workers are daemonic and cannot start processes of their own, so each variant
+    runs the "rolling horizon" and "clusters" engines in sequence (workers=1), without
+    the solver portfolio and without checkpoints (the variants would share the file).
+    CBC gets its share of the cores (_inputs["threads"]).
+    Returns: (settings, dictionary of figures)
+    """
+    times, faculty, students = _inputs["times"], _inputs["faculty"], _inputs["students"]
+    saved = {key: getattr(aws, key) for key in ["interview_number", "max_faculty_interview", "weights",
+                                                "workers", "portfolio", "checkpoint", "backend_options"]}
+    aws.workers, aws.portfolio, aws.checkpoint = 1, [], None
+    aws.backend_options = dict(aws.backend_options,
+                               cbc=dict(aws.backend_options["cbc"], threads=_inputs["threads"]))
+    for key, value in settings.items():
+        if key in ["interview_number", "max_faculty_interview"]:
+            setattr(aws, key, value)
+        else:
+            aws.weights = dict(aws.weights, **{key: value})
+
+    try:
+        start_time = time_module.time()
+        variant = variant_students(students, settings)
+        matrix = aws.schedule(times, faculty, variant, [])
+        seconds = time_module.time() - start_time
+        variant_total = aws.objective_parts(matrix, times, faculty, variant)["total"]
+
+        # Figures from the base weights and the input matching scores, so the variants
+        # compare on the same scale. The counts keep the interview number of the variant
+        aws.weights = saved["weights"]
+        stats = aws.matrix_stats(matrix, times, faculty, students)
+    finally:
+        for key, value in saved.items():
+            setattr(aws, key, value)
+    stats["variant total"] = variant_total
+    stats["seconds"] = seconds
+    return (settings, stats)
+
+
+def sweep(times, faculty, students, grid, workers=None):
+    """
+    Solves every combination of parameter values of the grid in a process pool,
+    with the data loaded once. The pool needs the "fork" start method (see _solve_variant):
+    where it does not exist (Windows), the variants are solved one at a time.
+    Returns: list of (settings, dictionary of figures)
+    """
+    variants = settings_grid(grid)
+    print(f"Sweep: {len(variants)} variants")
+    _inputs.update(times=times, faculty=faculty, students=students)
+    if "fork" not in multiprocessing.get_all_start_methods():
+        print("Sweep: no fork start method here, solving the variants in sequence")
+        _inputs["threads"] = aws.backend_options["cbc"]["threads"]
+        return [_solve_variant(settings) for settings in variants]
+    # The cores are shared by the variants solved at the same time
+    workers = workers or os.cpu_count()
+    _inputs["threads"] = max(1, os.cpu_count() // workers)
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        rows = pool.map(_solve_variant, variants, chunksize=1)
+    return rows
+
+
+def print_table(rows, filename=None):
+    """
+    Prints the comparison table of a sweep, and writes it as CSV if a filename is given
+    """
+    keys = list(rows[0][0]) if rows else []
+    table = [keys + columns]
+    for settings, stats in rows:
+        table.append([settings[key] for key in keys]
+                     + [round(stats[column], 2) if isinstance(stats[column], float) else stats[column]
+                        for column in columns])
+
+    widths = [max(len(str(row[i])) for row in table) for i in range(len(table[0]))]
+    for row in table:
+        print("  ".join(str(cell).rjust(width) for cell, width in zip(row, widths)))
+
+    if filename:
+        with open(filename, "w", newline="") as f:
+            csv.writer(f).writerows(table)
+
+
+if __name__ == "__main__":
+    selection_db, matrix_db = aws.connect()
+    aws.resume = False  # Variants start from scratch
+    times, faculty, students, previous = aws.load_inputs(selection_db, matrix_db, read_only=True)
+    matrix_db.close()
+    if not feasibility.check(times, faculty, students) and not aws.elastic:
+        raise SystemExit("Fix the data above before the sweep")
+
+    rows = sweep(times, faculty, students, sweep_grid, sweep_workers)
+    print_table(rows, sweep_output)